@@ -57,6 +57,11 @@ class CalificacionAdmin(admin.ModelAdmin):
     # Nota: el doble guion bajo "__" permite buscar por campo de relación ForeignKey
     search_fields = ("instrumento__nombre",)
 
+    def save_model(self, request, obj, form, change):
+        # Edición manual: la huella de carga masiva deja de ser válida
+        obj.row_hash = ""
+        super().save_model(request, obj, form, change)
+
 
 # =============================================================================
 # Factor Valor (posiciones 8..37)
@@ -66,6 +71,20 @@ class FactorValorAdmin(admin.ModelAdmin):
     list_display = ("id", "calificacion", "posicion", "valor")
     list_filter  = ("posicion",)
 
+    # Cambios manuales de factores invalidan la huella de carga masiva
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        TblCalificacion.objects.filter(pk=obj.calificacion_id).update(row_hash="")
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        TblCalificacion.objects.filter(pk=obj.calificacion_id).update(row_hash="")
+
+    def delete_queryset(self, request, queryset):
+        ids = list(queryset.values_list("calificacion_id", flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        TblCalificacion.objects.filter(pk__in=ids).update(row_hash="")
+
 
 # =============================================================================
 # Definición de factores tributarios (posiciones 8..37)
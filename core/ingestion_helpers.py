@@ -2,17 +2,22 @@
 from __future__ import annotations
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime
-import csv, re
+import csv, logging, re
+from functools import lru_cache
 from io import TextIOWrapper
 import pdfplumber
-from decimal import Decimal
 
 from django.utils import timezone
 
 from core.models import TblCalificacion, TblTipoIngreso, TblMercado, TblFactorDef
 
 # Reutiliza las constantes del dominio desde views.py
-from core.views.mainv import POS_MIN, POS_BASE_MAX, POS_MAX
+from core.views.mainv import (
+    POS_MIN, POS_BASE_MAX, POS_MAX, POSICIONES, POSICIONES_BASE, ZERO, UNO, CUANTO_8,
+    catalogos_cache, _factores8_int, _montos_a_enteros,
+)
+
+logger = logging.getLogger(__name__)
 
 # -----------------------------
 # utils
@@ -23,17 +28,21 @@ def to_int(v, default=0):
     except Exception:
         return default
 
-def to_dec(v, default=Decimal("0")):
+def to_dec(v, default=ZERO):
     if v is None or v == "":
         return default
-    s = str(v).strip().replace(",", ".")
+    if isinstance(v, Decimal):
+        return v
+    s = v if isinstance(v, str) else str(v)
+    if "," in s:
+        s = s.replace(",", ".")
     try:
-        return Decimal(s)
+        return Decimal(s)  # Decimal ya ignora espacios al inicio/fin
     except Exception:
         return default
 
 def _round8(x: Decimal) -> Decimal:
-    return (x or Decimal("0")).quantize(Decimal("0.00000001"), rounding=ROUND_HALF_UP)
+    return (x or ZERO).quantize(CUANTO_8, rounding=ROUND_HALF_UP)
 
 def normalize_headers(headers: list[str]) -> list[str]:
     if not headers:
@@ -41,51 +50,96 @@ def normalize_headers(headers: list[str]) -> list[str]:
     h0 = headers[0].lstrip("\ufeff")
     return [h0] + [h.strip() for h in headers[1:]]
 
+# F<pos>_MONTO / F<pos>_FACTOR; memoizado: los encabezados se repiten entre archivos
+_FCOL_RE = re.compile(r"F(\d+)_(MONTO|FACTOR)")
+
+@lru_cache(maxsize=256)
+def _clasificar_col(h: str | None) -> tuple[int | None, str | None]:
+    m = _FCOL_RE.fullmatch((h or "").strip().upper())
+    if not m:
+        return None, None
+    pos = int(m.group(1))
+    if not POS_MIN <= pos <= POS_MAX:
+        return None, None
+    return pos, m.group(2)
+
 def is_factor_col(h: str) -> int|None:
-    H = (h or "").strip().upper()
-    if H.startswith("F") and H.endswith("_FACTOR"):
-        try:
-            pos = int(H[1:H.index("_")])
-            return pos if POS_MIN <= pos <= POS_MAX else None
-        except Exception:
-            return None
-    return None
+    pos, tipo = _clasificar_col(h)
+    return pos if tipo == "FACTOR" else None
 
 def is_monto_col(h: str) -> int|None:
-    H = (h or "").strip().upper()
-    if H.startswith("F") and H.endswith("_MONTO"):
-        try:
-            pos = int(H[1:H.index("_")])
-            return pos if POS_MIN <= pos <= POS_MAX else None
-        except Exception:
-            return None
-    return None
-
-def lookup_ci(d: dict, *names):
-    lower = {(k or "").lower(): v for k, v in d.items()}
-    for name in names:
-        v = lower.get((name or "").lower())
-        if v not in (None, ""):
-            return v
-    return ""
-
-def find_mercado(codigo_o_nombre: str):
+    pos, tipo = _clasificar_col(h)
+    return pos if tipo == "MONTO" else None
+
+# Campos de cabecera del CSV -> encabezados aceptados (sin distinguir
+# mayúsculas; gana el primero con valor no vacío)
+CSV_CAMPOS = {
+    "ejercicio":       ("EJERCICIO",),
+    "mercado_cod":     ("MERCADO_COD", "mercado", "codigo_mercado"),
+    "nemo":            ("NEMO", "instrumento"),
+    "fecha_pago":      ("FEC_PAGO", "fecha_pago"),
+    "sec_eve":         ("SEC_EVE", "secuencia_evento"),
+    "descripcion":     ("DESCRIPCION",),
+    "tipo_ingreso_id": ("TIPO_INGRESO_ID",),
+}
+
+# -----------------------------
+# catálogos cacheados (mercados / tipos de ingreso)
+# -----------------------------
+# Se cargan una vez y se guardan en la caché 'catalogos', compartida entre
+# workers: core/signals.py los invalida al guardar/eliminar para todos.
+# Leer la caché compartida cuesta un acceso a disco: los bucles por fila
+# traen el catálogo una vez y lo pasan a find_mercado/tipo_ingreso_by_id.
+MERCADOS_CACHE_KEY = "catalogo_mercados"
+TIPOS_INGRESO_CACHE_KEY = "catalogo_tipos_ingreso"
+CATALOGOS_CACHE_TTL = 60 * 60  # 1 hora
+
+def _mercados_catalogo() -> tuple[dict, dict]:
+    """
+    ({CODIGO: mercado}, {NOMBRE: mercado}) en mayúsculas (equivale a __iexact).
+    Ante claves repetidas gana el primero por nombre, igual que .first().
+    """
+    def _load():
+        por_codigo, por_nombre = {}, {}
+        for m in TblMercado.objects.order_by("nombre"):
+            if m.codigo:
+                por_codigo.setdefault(m.codigo.upper(), m)
+            por_nombre.setdefault(m.nombre.upper(), m)
+        return por_codigo, por_nombre
+
+    return catalogos_cache.get_or_set(MERCADOS_CACHE_KEY, _load, CATALOGOS_CACHE_TTL)
+
+def _tipos_ingreso_catalogo() -> dict[int, TblTipoIngreso]:
+    """{pk: TblTipoIngreso}"""
+    def _load():
+        return TblTipoIngreso.objects.in_bulk()
+
+    return catalogos_cache.get_or_set(TIPOS_INGRESO_CACHE_KEY, _load, CATALOGOS_CACHE_TTL)
+
+def find_mercado(codigo_o_nombre: str, catalogo: tuple[dict, dict] | None = None):
+    """catalogo: resultado de _mercados_catalogo() ya leído (bucles por fila)."""
     if not codigo_o_nombre:
         return None
-    s = str(codigo_o_nombre).strip()
-    m = TblMercado.objects.filter(codigo__iexact=s).first()
-    if m:
-        return m
-    return TblMercado.objects.filter(nombre__iexact=s).first()
+    s = str(codigo_o_nombre).strip().upper()
+    por_codigo, por_nombre = catalogo or _mercados_catalogo()
+    return por_codigo.get(s) or por_nombre.get(s)
 
-def tipo_ingreso_by_id(tipo_id: str|int|None):
+def tipo_ingreso_by_id(tipo_id: str|int|None, catalogo: dict | None = None):
+    """catalogo: resultado de _tipos_ingreso_catalogo() ya leído (bucles por fila)."""
     if not tipo_id:
         return None
+    if catalogo is None:
+        catalogo = _tipos_ingreso_catalogo()
     try:
-        return TblTipoIngreso.objects.get(pk=int(tipo_id))
+        return catalogo.get(int(tipo_id))
     except Exception:
         return None
 
+def default_tipo_ingreso():
+    """Tipo de ingreso por defecto (menor pk), desde el catálogo cacheado."""
+    tipos = _tipos_ingreso_catalogo()
+    return tipos[min(tipos)] if tipos else None
+
 def _factor_names_map() -> dict[int, str]:
     """
     Mapa {posicion:int -> 'F8 NombreFactor'} para adornar la preview.
@@ -106,29 +160,37 @@ def parse_csv(io_text: TextIOWrapper):
     except Exception:
         dialect = csv.excel
 
-    reader = csv.DictReader(io_text, dialect=dialect)
-    headers_raw = reader.fieldnames or []
-    headers = normalize_headers([h.strip() for h in headers_raw])
-    reader.fieldnames = headers
+    # csv.reader + índices resueltos una vez desde el encabezado (sin un dict
+    # por fila como DictReader ni búsquedas case-insensitive por celda)
+    reader = csv.reader(io_text, dialect=dialect)
+    headers = normalize_headers([h.strip() for h in next(reader, [])])
+    n_cols = len(headers)
 
     has_montos = any(is_monto_col(h) for h in headers)
     has_fact   = any(is_factor_col(h) for h in headers)
     modo = "montos" if (has_montos and not has_fact) else "factores" if has_fact else "montos"
 
+    # Campo -> índices de sus encabezados presentes, en orden de preferencia
+    idx_ci = {h.lower(): i for i, h in enumerate(headers)}
+    slots = {
+        campo: [idx_ci[a.lower()] for a in alias if a.lower() in idx_ci]
+        for campo, alias in CSV_CAMPOS.items()
+    }
+    # Columnas F*_MONTO / F*_FACTOR: clasificadas una vez, no por fila
+    fcols = [(h, i) for i, h in enumerate(headers) if is_monto_col(h) or is_factor_col(h)]
+
     rows = []
     for row in reader:
+        if not row:
+            continue  # línea vacía (DictReader también las salta)
+        if len(row) < n_cols:
+            row += [""] * (n_cols - len(row))
         r = {
-            "ejercicio":       lookup_ci(row, "EJERCICIO", "ejercicio"),
-            "mercado_cod":     lookup_ci(row, "MERCADO_COD", "mercado", "codigo_mercado"),
-            "nemo":            lookup_ci(row, "NEMO", "instrumento"),
-            "fecha_pago":      lookup_ci(row, "FEC_PAGO", "fecha_pago"),
-            "sec_eve":         lookup_ci(row, "SEC_EVE", "secuencia_evento"),
-            "descripcion":     lookup_ci(row, "DESCRIPCION"),
-            "tipo_ingreso_id": lookup_ci(row, "TIPO_INGRESO_ID"),
+            campo: next((row[i] for i in idxs if row[i] != ""), "")
+            for campo, idxs in slots.items()
         }
-        for h in headers:
-            if is_monto_col(h) or is_factor_col(h):
-                r[h] = row.get(h, "")
+        for h, i in fcols:
+            r[h] = row[i]
         rows.append(r)
     return rows, modo
 
@@ -158,6 +220,9 @@ def parse_cert70_text(pdf_file):
         with pdfplumber.open(pdf_file) as pdf:            
             for page_num, page in enumerate(pdf.pages, 1):                
                 tables = page.extract_tables()
+                # Las tablas ya son listas planas: libera los objetos
+                # (chars/layout) cacheados de la página antes de procesarlas
+                page.close()
                 
                 for table_num, tbl in enumerate(tables, 1):
                     if not tbl or len(tbl) < 2:
@@ -174,8 +239,9 @@ def parse_cert70_text(pdf_file):
                     if es_tabla_montos:
 
                         # Mostrar headers
-                        for idx, h in enumerate(tbl[0][:20]):
-                            print(f"  Col {idx}: {str(h)[:50]}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            for idx, h in enumerate(tbl[0][:20]):
+                                logger.debug("  Col %s: %s", idx, str(h)[:50])
                         
                         # Procesar filas de datos
                         for row_idx, row_data in enumerate(tbl[1:], 1):
@@ -225,9 +291,9 @@ def parse_cert70_text(pdf_file):
                                             dia, mes, anio = partes
                                             fecha_obj = datetime(int(anio), int(mes), int(dia))
                                             fecha = fecha_obj.strftime('%Y-%m-%d')
-                                            print(f"DEBUG: Fecha convertida: {fecha_raw} -> {fecha}")
+                                            logger.debug("Fecha convertida: %s -> %s", fecha_raw, fecha)
                                     except Exception as e:
-                                        print(f"DEBUG: Error convirtiendo fecha: {e}")
+                                        logger.debug("Error convirtiendo fecha: %s", e)
                                 
                                 div_nro = div_nros[subfila_idx]
                                 key = (fecha, div_nro)
@@ -243,7 +309,7 @@ def parse_cert70_text(pdf_file):
                                         try:
                                             sec_limpio = sec_str.replace(".", "").replace(",", ".")
                                             sec_evento = sec_limpio
-                                            print(f"  Col 4: Secuencia Evento (Monto Histórico) = {sec_evento}")
+                                            logger.debug("  Col 4: Secuencia Evento (Monto Histórico) = %s", sec_evento)
                                         except:
                                             pass
                                 
@@ -254,7 +320,7 @@ def parse_cert70_text(pdf_file):
                                         try:
                                             fa_limpio = fa_str.replace(".", "").replace(",", ".")
                                             factor_actualizacion = str(Decimal(fa_limpio))
-                                            print(f"  Col 5: Factor Actualización = {factor_actualizacion}")
+                                            logger.debug("  Col 5: Factor Actualización = %s", factor_actualizacion)
                                         except:
                                             pass
                                 
@@ -291,18 +357,19 @@ def parse_cert70_text(pdf_file):
                                     try:
                                         val = Decimal(valor_limpio)
                                         rows_por_dividendo[key][f"F{pos_factor}_MONTO"] = str(val)
-                                        print(f"  Col {col_pdf} (Página 1): {valor_str} -> F{pos_factor}_MONTO = {val}")
+                                        logger.debug("  Col %s (Página 1): %s -> F%s_MONTO = %s", col_pdf, valor_str, pos_factor, val)
                                     except Exception as e:
                                         rows_por_dividendo[key][f"F{pos_factor}_MONTO"] = "0"
-                                        print(f"  Col {col_pdf}: Error - {e}")
+                                        logger.debug("  Col %s: Error - %s", col_pdf, e)
                     
                     # ============================================================
                     # PÁGINA 2: CRÉDITOS (F20-F37)
                     # ============================================================
                     elif es_tabla_creditos:
                         # Mostrar headers
-                        for idx, h in enumerate(tbl[0][:20]):
-                            print(f"  Col {idx}: {str(h)[:50]}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            for idx, h in enumerate(tbl[0][:20]):
+                                logger.debug("  Col %s: %s", idx, str(h)[:50])
                         
                         # MAPEO: columnas físicas del PDF → posiciones F20-F37
                         # Col 2 del PDF = F20, Col 3 = F21, ..., Col 19 = F37
@@ -381,7 +448,7 @@ def parse_cert70_text(pdf_file):
                                                                 
                                 # Buscar la entrada existente de página 1
                                 if key not in rows_por_dividendo:
-                                    print(f"WARNING: No se encontró entrada de página 1 para {key}")
+                                    logger.warning("No se encontró entrada de página 1 para %s", key)
                                     rows_por_dividendo[key] = {
                                         "ejercicio": "2020",
                                         "mercado_cod": "ACC",
@@ -408,7 +475,7 @@ def parse_cert70_text(pdf_file):
                                     try:
                                         val = Decimal(valor_limpio)
                                         rows_por_dividendo[key][f"F{pos_factor}_MONTO"] = str(val)
-                                        print(f"  Col {col_idx} (Página 2): {valor_str} -> F{pos_factor}_MONTO = {val}")
+                                        logger.debug("  Col %s (Página 2): %s -> F%s_MONTO = %s", col_idx, valor_str, pos_factor, val)
                                     except Exception as e:
                                         rows_por_dividendo[key][f"F{pos_factor}_MONTO"] = "0"
         
@@ -421,16 +488,14 @@ def parse_cert70_text(pdf_file):
                     row_data[f"F{pos}_MONTO"] = "0"
             rows.append(row_data)
         
-        print(f"\n{'='*60}")
-        for row in rows:
-            montos_keys = [k for k in row.keys() if '_MONTO' in k and row[k] != '0']
-            print(f"  {row['fecha_pago']} Div.{row['sec_eve']}: {len(montos_keys)} montos con valores")
-        print(f"{'='*60}")
+        if logger.isEnabledFor(logging.DEBUG):
+            for row in rows:
+                montos_keys = [k for k in row.keys() if '_MONTO' in k and row[k] != '0']
+                logger.debug("  %s Div.%s: %s montos con valores",
+                             row['fecha_pago'], row['sec_eve'], len(montos_keys))
         
     except Exception as e:
-        print(f"ERROR CRÍTICO al procesar PDF: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("ERROR CRÍTICO al procesar PDF: %s: %s", type(e).__name__, e)
     
     return rows, "montos"
 
@@ -442,46 +507,58 @@ def annotate_preview(rows: list[dict], modo: str):
     Enriquecer 'rows' con:
       - status: 'nuevo'|'actualiza'
       - factores_con_valor, suma_8_19 (string)
-      - pre_error / pre_warning (bool)
+      - pre_error / pre_warning (bool); pre_error incluye mercado no encontrado
       - descripcion extendida con detalle de factores/montos y, si corresponde,
         factores DERIVADOS desde montos + suma 8–19 calculada.
+    Devuelve (errores, advertencias): conteos acumulados en la misma pasada.
 
     No requiere cambios en templates: la columna 'Descripción' ya se muestra.
     """
     names_map = _factor_names_map()  # opcional para mostrar nombres
 
-    for r in rows:
+    # Columnas F*_FACTOR / F*_MONTO clasificadas una vez por archivo, no por fila
+    columnas = set().union(*rows)
+    factor_cols = {k: pos for k in columnas if (pos := is_factor_col(k))}
+    monto_cols = {k: pos for k in columnas if (pos := is_monto_col(k))}
+
+    # Claves (ejercicio, secuencia_evento) ya en BD: una consulta para todo el
+    # archivo en vez de un EXISTS por fila
+    claves_filas = [(to_int(r.get("ejercicio")), to_int(r.get("sec_eve"))) for r in rows]
+    existentes = set(
+        TblCalificacion.objects.filter(
+            ejercicio__in={ej for ej, _ in claves_filas},
+            secuencia_evento__in={se for _, se in claves_filas},
+        ).values_list("ejercicio", "secuencia_evento")
+    ) if claves_filas else set()
+
+    mercados = _mercados_catalogo()   # una lectura de la caché por archivo
+
+    n_errores = n_advertencias = 0
+    for r, clave in zip(rows, claves_filas):
         try:
-            ej = to_int(r.get("ejercicio"))
-            se = to_int(r.get("sec_eve"))
-            exists = TblCalificacion.objects.filter(ejercicio=ej, secuencia_evento=se).exists()
-            r["status"] = "actualiza" if exists else "nuevo"
+            r["status"] = "actualiza" if clave in existentes else "nuevo"
 
             base_desc = (r.get("descripcion") or "").strip()
             desc_chunks = [base_desc] if base_desc else []
 
             factores_con_valor = 0
-            suma_8_19 = Decimal("0")
-            total_base_montos = Decimal("0")
+            suma_8_19 = ZERO
+            total_base_montos = 0   # centavos, igual que al confirmar
 
             # ----- recolectar datos crudos
             factores = {}
             montos = {}
-            for k, v in list(r.items()):
-                posF = is_factor_col(k)
-                posM = is_monto_col(k)
-                if posF:
-                    val = to_dec(v)
+            for k, posF in factor_cols.items():
+                if k in r:
+                    val = to_dec(r[k])
                     factores[posF] = val
                     if val != 0:
                         factores_con_valor += 1
                     if POS_MIN <= posF <= POS_BASE_MAX:
                         suma_8_19 += val
-                if posM:
-                    m = to_dec(v)
-                    montos[posM] = m
-                    if POS_MIN <= posM <= POS_BASE_MAX:
-                        total_base_montos += m
+            for k, posM in monto_cols.items():
+                if k in r:
+                    montos[posM] = to_dec(r[k])
 
             # ----- detalle de factores declarados (modo factores)
             if modo == "factores" and factores:
@@ -508,21 +585,21 @@ def annotate_preview(rows: list[dict], modo: str):
                 if montos_txt:
                     desc_chunks.append("Detalle(montos): " + ", ".join(montos_txt))
 
-                # Derivar factores
-                factores_deriv = {}
+                # Derivar factores con la misma aritmética que carga_confirmar
+                # (centavos + restos mayores en 8..19): la suma base mostrada
+                # es la que se grabará. Monto fuera de rango: ValueError -> pre_error
+                enteros = _montos_a_enteros(montos)
+                total_base_montos = sum(v for pos, v in enteros.items() if pos in POSICIONES_BASE)
+                factores_deriv = {pos: ZERO for pos in POSICIONES}
                 if total_base_montos > 0:
-                    for pos in range(POS_MIN, POS_MAX + 1):
-                        m = montos.get(pos, Decimal("0"))
-                        factores_deriv[pos] = _round8(m / total_base_montos)
-                else:
-                    for pos in range(POS_MIN, POS_MAX + 1):
-                        factores_deriv[pos] = Decimal("0")
+                    for pos, f_int in _factores8_int(enteros, total_base_montos).items():
+                        factores_deriv[pos] = Decimal(f_int).scaleb(-8)
 
                 # Sumar 8-19 y listar los > 0
-                suma_calc = Decimal("0")
+                suma_calc = ZERO
                 pares_fact_derived = []
                 claves = []
-                for pos in range(POS_MIN, POS_MAX + 1):
+                for pos in POSICIONES:
                     fval = factores_deriv[pos]
                     if POS_MIN <= pos <= POS_BASE_MAX:
                         suma_calc += fval
@@ -541,8 +618,10 @@ def annotate_preview(rows: list[dict], modo: str):
             pre_warning = False
             if modo == "montos" and total_base_montos <= 0:
                 pre_error = True          # no se podrán calcular factores
-            if modo == "factores" and suma_8_19 > Decimal("1"):
+            if modo == "factores" and suma_8_19 > UNO:
                 pre_error = True          # suma inválida
+            if find_mercado(r.get("mercado_cod") or r.get("mercado"), mercados) is None:
+                pre_error = True          # mercado inexistente: confirmar omitiría la fila
             if (r.get("mercado_cod") or "").strip() == "" or (r.get("sec_eve") or "").strip() == "":
                 pre_warning = True
             if r["status"] == "actualiza":
@@ -550,6 +629,8 @@ def annotate_preview(rows: list[dict], modo: str):
 
             r["pre_error"] = pre_error
             r["pre_warning"] = (not pre_error) and pre_warning
+            n_errores += pre_error
+            n_advertencias += r["pre_warning"]
 
             # Unifica la descripción extendida para que se vea en la tabla sin tocar templates
             if desc_chunks:
@@ -561,3 +642,6 @@ def annotate_preview(rows: list[dict], modo: str):
             r["suma_8_19"] = "0"
             r["pre_error"] = True
             r["pre_warning"] = False
+            n_errores += 1
+
+    return n_errores, n_advertencias
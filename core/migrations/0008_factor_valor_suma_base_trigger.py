@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# --- Invariante en BD: suma de factores 8..19 por calificación <= 1 ---
+# Trigger AFTER ... FOR EACH STATEMENT con tabla de transición: revisa cada
+# calificación tocada una sola vez al terminar la sentencia (INSERT, UPDATE,
+# upsert o COPY), en vez de recalcular SUM(valor) por cada fila 8..19 escrita.
+# No es diferido: cada sentencia debe dejar la suma válida. Las escrituras
+# de la app graban las 30 posiciones de una calificación en una sola sentencia.
+# Postgres no admite tablas de transición en triggers de varios eventos ni
+# con lista de columnas: un trigger para INSERT y otro para UPDATE.
+# ERRCODE check_violation (23514) + CONSTRAINT chk_suma_factores_base: Django
+# lo levanta como IntegrityError y las vistas lo distinguen por el nombre.
+CREATE_SQL = r"""
+CREATE OR REPLACE FUNCTION f_check_suma_factores_base_stmt()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_calif INTEGER;
+  v_suma  NUMERIC;
+BEGIN
+  SELECT fv.calificacion_id, SUM(fv.valor)
+    INTO v_calif, v_suma
+  FROM "TBL_FACTOR_VALOR" AS fv
+  WHERE fv.calificacion_id IN (
+          SELECT n.calificacion_id FROM nuevas AS n
+          WHERE n.posicion BETWEEN 8 AND 19
+        )
+    AND fv.posicion BETWEEN 8 AND 19
+  GROUP BY fv.calificacion_id
+  HAVING SUM(fv.valor) > 1
+  LIMIT 1;
+
+  IF FOUND THEN
+    RAISE EXCEPTION 'Suma de factores 8..19 = % supera 1 (calificación %)',
+                    v_suma, v_calif
+      USING ERRCODE = 'check_violation', CONSTRAINT = 'chk_suma_factores_base';
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_check_suma_factores_base_ins
+  AFTER INSERT ON "TBL_FACTOR_VALOR"
+  REFERENCING NEW TABLE AS nuevas
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION f_check_suma_factores_base_stmt();
+
+CREATE TRIGGER trg_check_suma_factores_base_upd
+  AFTER UPDATE ON "TBL_FACTOR_VALOR"
+  REFERENCING NEW TABLE AS nuevas
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION f_check_suma_factores_base_stmt();
+"""
+
+ROLLBACK_SQL = r"""
+DROP TRIGGER IF EXISTS trg_check_suma_factores_base_ins ON "TBL_FACTOR_VALOR";
+DROP TRIGGER IF EXISTS trg_check_suma_factores_base_upd ON "TBL_FACTOR_VALOR";
+DROP FUNCTION IF EXISTS f_check_suma_factores_base_stmt();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_tblarchivofuente_hash_contenido_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_SQL, reverse_sql=ROLLBACK_SQL),
+    ]
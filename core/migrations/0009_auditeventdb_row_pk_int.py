@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+# --- row_pk numérico en audit.events ---
+# Columna generada (STORED) con el row_pk casteado a BIGINT + índice.
+# Permite filtrar/agrupar por calificación sin CAST por fila en cada consulta.
+# (El CASE evita fallar si alguna fila histórica trae un PK no numérico.)
+CREATE_SQL = r"""
+ALTER TABLE audit.events
+  ADD COLUMN IF NOT EXISTS row_pk_int BIGINT
+  GENERATED ALWAYS AS (
+    CASE WHEN row_pk ~ '^[0-9]+$' THEN row_pk::bigint END
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_audit_events_row_pk_int
+  ON audit.events (row_pk_int);
+"""
+
+ROLLBACK_SQL = r"""
+DROP INDEX IF EXISTS audit.ix_audit_events_row_pk_int;
+ALTER TABLE audit.events DROP COLUMN IF EXISTS row_pk_int;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_factor_valor_suma_base_trigger'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_SQL, reverse_sql=ROLLBACK_SQL),
+        # Modelo unmanaged: AddField solo actualiza el estado de migraciones
+        migrations.AddField(
+            model_name='auditeventdb',
+            name='row_pk_int',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# --- Índice de cobertura para la vista de Auditoría ---
+# Todas las consultas de auditoria_list filtran por table_name y rango de
+# changed_at; las de claves de grupo y métricas solo leen op, row_pk_int y
+# app_user -> se sirven con index-only scan. (Sin JSON en el INCLUDE:
+# before_row/after_row son pesados y solo se leen para la página visible.)
+CREATE_SQL = r"""
+CREATE INDEX IF NOT EXISTS ix_audit_events_tabla_fecha
+  ON audit.events (table_name, changed_at DESC)
+  INCLUDE (op, row_pk_int, app_user);
+"""
+
+ROLLBACK_SQL = r"""
+DROP INDEX IF EXISTS audit.ix_audit_events_tabla_fecha;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_auditeventdb_row_pk_int'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_SQL, reverse_sql=ROLLBACK_SQL),
+    ]
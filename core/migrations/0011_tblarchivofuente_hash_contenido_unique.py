@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-16 10:12
+
+from django.db import migrations, models
+
+# --- Hashes repetidos antes del índice único ---
+# Archivos subidos antes de la deduplicación pueden compartir hash_contenido;
+# el índice único fallaría al crearse. Se conserva el hash en el registro más
+# antiguo y los demás quedan en NULL (NULL no colisiona). No se borra ningún
+# registro: las calificaciones siguen apuntando a su archivo.
+# Reversa: nada que deshacer (los hashes anulados no se recuperan, y sin el
+# índice único no son necesarios).
+DEDUP_HASH_SQL = r"""
+UPDATE "TBL_ARCHIVO_FUENTE" AS af
+SET hash_contenido = NULL
+WHERE af.hash_contenido IS NOT NULL
+  AND EXISTS (
+    SELECT 1
+    FROM "TBL_ARCHIVO_FUENTE" AS otro
+    WHERE otro.hash_contenido = af.hash_contenido
+      AND otro.archivo_fuente_id < af.archivo_fuente_id
+  );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_audit_events_covering_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=DEDUP_HASH_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='tblarchivofuente',
+            name='hash_contenido',
+            field=models.CharField(blank=True, help_text='SHA256 hash del contenido del archivo', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-16 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tblarchivofuente_hash_contenido_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tblcalificacion',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
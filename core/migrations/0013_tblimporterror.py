@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-16 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_tblcalificacion_row_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TblImportError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila', models.IntegerField(blank=True, null=True, verbose_name='Fila')),
+                ('mensaje', models.TextField(verbose_name='Mensaje')),
+                ('archivo_fuente', models.ForeignKey(db_column='archivo_fuente_id', on_delete=django.db.models.deletion.CASCADE, related_name='errores_import', to='core.tblarchivofuente', verbose_name='Archivo Fuente')),
+            ],
+            options={
+                'verbose_name': 'Error de Carga',
+                'verbose_name_plural': 'Errores de Carga',
+                'db_table': 'TBL_IMPORT_ERROR',
+                'ordering': ['id'],
+            },
+        ),
+    ]
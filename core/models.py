@@ -136,7 +136,7 @@ class TblArchivoFuente(models.Model):
         max_length=64,
         null=True,
         blank=True,
-        db_index=True,  # Índice para búsquedas rápidas
+        unique=True,  # Índice único: dedup atómico de archivos (NULL no colisiona)
         help_text='SHA256 hash del contenido del archivo'
     )
     tamanio_bytes = models.BigIntegerField(
@@ -155,6 +155,29 @@ class TblArchivoFuente(models.Model):
         return self.nombre_archivo
 
 
+class TblImportError(models.Model):
+    """Filas omitidas en la última carga masiva de un archivo (reporte paginado)."""
+
+    archivo_fuente = models.ForeignKey(
+        TblArchivoFuente,
+        on_delete=models.CASCADE,
+        db_column="archivo_fuente_id",
+        related_name="errores_import",
+        verbose_name="Archivo Fuente",
+    )
+    fila = models.IntegerField(null=True, blank=True, verbose_name="Fila")  # None: error de lote
+    mensaje = models.TextField(verbose_name="Mensaje")
+
+    class Meta:
+        db_table = "TBL_IMPORT_ERROR"
+        verbose_name = "Error de Carga"
+        verbose_name_plural = "Errores de Carga"
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        return f"{self.archivo_fuente_id} fila {self.fila}: {self.mensaje}"
+
+
 # =============================================================================
 # MODELOS PRINCIPALES DE NEGOCIO
 # =============================================================================
@@ -228,6 +251,10 @@ class TblCalificacion(models.Model):
         related_name="calificaciones",
         verbose_name="Archivo Fuente",
     )
+    # Huella SHA256 de la última fila de carga masiva aplicada (cabecera +
+    # factores). Un re-import con la misma huella no escribe nada. Se vacía
+    # ante cualquier edición manual.
+    row_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
 
     class Meta:
         db_table = "TBL_CALIFICACION"
@@ -29,6 +29,9 @@ class AuditEventDB(models.Model):
         choices=[("I", "Insert"), ("U", "Update"), ("D", "Delete")],
     )
     row_pk       = models.CharField(max_length=128)  # PK de la fila afectada (texto)
+    row_pk_int   = models.BigIntegerField(           # row_pk como BIGINT (columna generada en BD, indexada)
+        null=True, blank=True, editable=False,
+    )
 
     # Usuario de BD (cuenta técnica con la que se conectó la app)
     db_user = models.CharField(max_length=128)
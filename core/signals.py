@@ -0,0 +1,35 @@
+# core/signals.py
+"""
+Señales del módulo core:
+- Invalidación de la caché del catálogo de factores (TblFactorDef)
+- Invalidación de los catálogos de mercados y tipos de ingreso (carga masiva)
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.ingestion_helpers import MERCADOS_CACHE_KEY, TIPOS_INGRESO_CACHE_KEY
+from core.models import TblFactorDef, TblMercado, TblTipoIngreso
+from core.views.mainv import FACTOR_DEFS_CACHE_KEY, catalogos_cache
+
+
+@receiver([post_save, post_delete], sender=TblFactorDef)
+def invalidar_cache_factor_defs(sender, **kwargs):
+    """Cualquier alta/edición/baja del catálogo descarta el def_map cacheado (al COMMIT)."""
+    transaction.on_commit(lambda: catalogos_cache.delete(FACTOR_DEFS_CACHE_KEY))
+
+
+@receiver([post_save, post_delete], sender=TblMercado)
+def invalidar_cache_mercados(sender, **kwargs):
+    """
+    Altas/ediciones/bajas de mercados descartan el catálogo cacheado.
+    Al COMMIT: antes, otro worker podría recargar la versión vieja.
+    """
+    transaction.on_commit(lambda: catalogos_cache.delete(MERCADOS_CACHE_KEY))
+
+
+@receiver([post_save, post_delete], sender=TblTipoIngreso)
+def invalidar_cache_tipos_ingreso(sender, **kwargs):
+    """Altas/ediciones/bajas de tipos de ingreso descartan el catálogo cacheado (al COMMIT)."""
+    transaction.on_commit(lambda: catalogos_cache.delete(TIPOS_INGRESO_CACHE_KEY))
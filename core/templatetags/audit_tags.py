@@ -0,0 +1,20 @@
+# core/templatetags/audit_tags.py
+"""
+Filtros de template para la vista de Auditoría.
+"""
+import json
+
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def pretty_json(value):
+    """
+    Serializa before_row/after_row con indentación para mostrarlos en <pre>.
+    Se aplica al renderizar: solo pagan el costo las filas visibles.
+    """
+    if not value:
+        return ""
+    return json.dumps(value, ensure_ascii=False, indent=2, sort_keys=True)
@@ -1,3 +1,209 @@
-from django.test import TestCase
+"""
+Pruebas del módulo core:
+- Carga masiva CSV (carga_archivo -> carga_confirmar): altas, re-import,
+  filas omitidas y reporte persistido en TBL_IMPORT_ERROR.
+- Trigger de BD que exige suma de factores 8..19 <= 1 por calificación.
 
-# Create your tests here.
+Requieren PostgreSQL (COPY, triggers de las migraciones).
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import (
+    TblArchivoFuente, TblCalificacion, TblFactorValor, TblImportError,
+    TblMercado, TblTipoIngreso,
+)
+from core.views.mainv import _excede_suma_base
+
+# Cachés en memoria (aisladas por prueba) y archivos sin S3
+CACHES_PRUEBA = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+    for alias in ("default", "catalogos", "uploads", "pdf_parse")
+}
+STORAGES_PRUEBA = {
+    "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+ENCABEZADO = "EJERCICIO,MERCADO_COD,NEMO,FEC_PAGO,SEC_EVE,DESCRIPCION,F8_MONTO,F9_MONTO\n"
+
+
+def _csv(*filas: str) -> bytes:
+    return (ENCABEZADO + "".join(f + "\n" for f in filas)).encode()
+
+
+# =============================================================================
+# CARGA MASIVA (CSV)
+# =============================================================================
+@override_settings(CACHES=CACHES_PRUEBA, STORAGES=STORAGES_PRUEBA)
+class CargaMasivaCsvTests(TestCase):
+
+    # Fila 1 y 2: válidas. Fila 3: sin fecha de pago (no se puede crear).
+    # Fila 4: instrumento más largo que la columna (varchar 120).
+    CSV_BASE = _csv(
+        "2024,ACC,AAA,2024-05-10,10001,Dividendo A,100,300",
+        "2024,ACC,BBB,2024-05-10,10002,Dividendo B,50,50",
+        "2024,ACC,CCC,,10003,Sin fecha,10,0",
+        "2024,ACC," + "D" * 121 + ",2024-05-10,10004,Nemo largo,10,10",
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("analista", "analista@example.com", "clave")
+        cls.mercado = TblMercado.objects.create(nombre="Acciones", codigo="ACC")
+        TblTipoIngreso.objects.create(nombre_tipo_ingreso="Carga masiva", prioridad=1)
+
+    def setUp(self):
+        # LocMem conserva datos entre pruebas del mismo proceso
+        for alias in CACHES_PRUEBA:
+            caches[alias].clear()
+        self.client.force_login(self.user)
+
+    def _importar(self, contenido: bytes, nombre: str = "carga.csv") -> str:
+        """Sube el CSV (vista previa), confirma y devuelve el mensaje de resumen."""
+        resp = self.client.post(
+            reverse("carga_archivo"),
+            {"archivo": SimpleUploadedFile(nombre, contenido, content_type="text/csv")},
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.context["can_import"])
+
+        resp = self.client.post(reverse("carga_archivo_confirmar"))
+        self.assertRedirects(resp, reverse("main"), fetch_redirect_response=False)
+        resumen = [str(m) for m in get_messages(resp.wsgi_request) if str(m).startswith("Grabado OK")]
+        self.assertEqual(len(resumen), 1)
+        return resumen[0]
+
+    def _factores(self, sec_eve: int) -> dict[int, Decimal]:
+        return dict(
+            TblFactorValor.objects
+            .filter(calificacion__ejercicio=2024, calificacion__secuencia_evento=sec_eve)
+            .values_list("posicion", "valor")
+        )
+
+    def test_importa_y_reimporta_el_mismo_archivo(self):
+        self.assertEqual(
+            self._importar(self.CSV_BASE),
+            "Grabado OK. Creados: 2, Actualizados: 0, Sin cambios: 0, Omitidos: 2.",
+        )
+        self.assertEqual(TblCalificacion.objects.count(), 2)
+
+        # Montos -> factores proporcionales a la base 8..19; las 30 posiciones
+        factores = self._factores(10001)
+        self.assertEqual(len(factores), 30)
+        self.assertEqual(factores[8], Decimal("0.25"))
+        self.assertEqual(factores[9], Decimal("0.75"))
+        self.assertEqual(factores[20], Decimal("0"))
+
+        # Reporte de filas omitidas persistido para el archivo
+        archivo = TblArchivoFuente.objects.get()
+        errores = list(
+            TblImportError.objects.filter(archivo_fuente=archivo)
+            .order_by("fila").values_list("fila", "mensaje")
+        )
+        self.assertEqual([fila for fila, _ in errores], [3, 4])
+        self.assertIn("fecha de pago", errores[0][1])
+        self.assertIn("instrumento supera 120 caracteres", errores[1][1])
+
+        # Mismo archivo, mismo usuario: nada que escribir; el reporte se reemplaza
+        self.assertEqual(
+            self._importar(self.CSV_BASE),
+            "Grabado OK. Creados: 0, Actualizados: 0, Sin cambios: 2, Omitidos: 2.",
+        )
+        self.assertEqual(TblArchivoFuente.objects.count(), 1)
+        self.assertEqual(TblImportError.objects.filter(archivo_fuente=archivo).count(), 2)
+
+    def test_reimport_con_cambios_actualiza(self):
+        self._importar(self.CSV_BASE)
+        calif = TblCalificacion.objects.get(secuencia_evento=10001)
+
+        modificado = _csv(
+            "2024,ACC,AAA,2024-05-10,10001,Dividendo A,300,100",   # cambian los montos
+            "2024,ACC,BBB,2024-05-10,10002,Dividendo B,50,50",
+        )
+        # Otro archivo: ambas filas re-apuntan su archivo fuente
+        self.assertEqual(
+            self._importar(modificado, "carga2.csv"),
+            "Grabado OK. Creados: 0, Actualizados: 2, Sin cambios: 0, Omitidos: 0.",
+        )
+        calif.refresh_from_db()
+        nuevo = TblArchivoFuente.objects.get(nombre_archivo="carga2.csv")
+        self.assertEqual(calif.archivo_fuente_id, nuevo.pk)
+        factores = self._factores(10001)
+        self.assertEqual(factores[8], Decimal("0.75"))
+        self.assertEqual(factores[9], Decimal("0.25"))
+        self.assertFalse(TblImportError.objects.filter(archivo_fuente=nuevo).exists())
+
+    def test_clave_repetida_gana_la_ultima_fila(self):
+        contenido = _csv(
+            "2024,ACC,AAA,2024-05-10,10001,Primera,100,100",
+            "2024,ACC,AAA,2024-05-10,10001,Segunda,100,300",
+        )
+        self.assertEqual(
+            self._importar(contenido),
+            "Grabado OK. Creados: 1, Actualizados: 1, Sin cambios: 0, Omitidos: 0.",
+        )
+        self.assertEqual(TblCalificacion.objects.count(), 1)
+        factores = self._factores(10001)
+        self.assertEqual(factores[8], Decimal("0.25"))
+        self.assertEqual(factores[9], Decimal("0.75"))
+
+    def test_montos_iguales_suman_exactamente_uno(self):
+        # 6 montos iguales: 1/6 redondeado HALF_UP sumaría 1.00000002
+        encabezado = "EJERCICIO,MERCADO_COD,NEMO,FEC_PAGO,SEC_EVE,DESCRIPCION,"
+        encabezado += ",".join(f"F{pos}_MONTO" for pos in range(8, 14)) + "\n"
+        contenido = (encabezado + "2024,ACC,AAA,2024-05-10,10001,Sextos," + ",".join(["1"] * 6) + "\n").encode()
+        self.assertEqual(
+            self._importar(contenido),
+            "Grabado OK. Creados: 1, Actualizados: 0, Sin cambios: 0, Omitidos: 0.",
+        )
+        factores = self._factores(10001)
+        self.assertEqual(sum(factores[pos] for pos in range(8, 20)), Decimal("1"))
+        self.assertEqual(factores[8], Decimal("0.16666667"))
+
+
+# =============================================================================
+# TRIGGER SUMA 8..19 <= 1
+# =============================================================================
+class SumaFactoresBaseTriggerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("operador")
+        cls.calif = TblCalificacion.objects.create(
+            mercado=TblMercado.objects.create(nombre="Acciones", codigo="ACC"),
+            instrumento_text="AAA",
+            tipo_ingreso=TblTipoIngreso.objects.create(nombre_tipo_ingreso="Corredor", prioridad=1),
+            fecha_pago_dividendo=date(2024, 5, 10),
+            ejercicio=2024,
+            secuencia_evento=10001,
+            usuario=user,
+        )
+
+    def _factor(self, posicion: int, valor: str) -> TblFactorValor:
+        return TblFactorValor(calificacion=self.calif, posicion=posicion, valor=Decimal(valor))
+
+    def test_rechaza_suma_mayor_a_uno(self):
+        with self.assertRaises(IntegrityError) as ctx, transaction.atomic():
+            TblFactorValor.objects.bulk_create([self._factor(8, "0.6"), self._factor(9, "0.5")])
+        self.assertTrue(_excede_suma_base(ctx.exception))
+        self.assertFalse(TblFactorValor.objects.filter(calificacion=self.calif).exists())
+
+    def test_rechaza_update_que_supera_uno(self):
+        TblFactorValor.objects.bulk_create([self._factor(8, "0.5"), self._factor(9, "0.5")])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TblFactorValor.objects.filter(calificacion=self.calif, posicion=9).update(valor=Decimal("0.6"))
+
+    def test_acepta_suma_uno_y_posiciones_fuera_de_base(self):
+        TblFactorValor.objects.bulk_create([
+            self._factor(8, "0.5"), self._factor(19, "0.5"), self._factor(20, "0.9"),
+        ])
+        self.assertEqual(TblFactorValor.objects.filter(calificacion=self.calif).count(), 3)
@@ -32,6 +32,8 @@ urlpatterns = [
          carga_views.carga_archivo, name="carga_archivo"),
     path("calificaciones/carga-masiva/confirmar/",
          carga_views.carga_confirmar, name="carga_archivo_confirmar"),
+    path("calificaciones/carga-masiva/<int:archivo_fuente_id>/errores/",
+         carga_views.carga_errores, name="carga_errores"),
 
     # --- Auditoría ---
     path("auditoria/",
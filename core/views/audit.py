@@ -5,17 +5,23 @@ Auditoría:
 - Métricas: conteos por tipo y usuarios activos
 - Ping: /audit-ping/ para diagnosticar GUCs
 """
-from itertools import groupby
-import json
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+import logging
 import os
 
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.files.storage import default_storage
 from django.core.paginator import Paginator
 from django.db import connection
+from django.db.models import (
+    Case, CharField, Count, Exists, F, Max, Min, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Cast, Concat
 from django.http import JsonResponse, FileResponse, Http404
 from django.shortcuts import render, get_object_or_404
-from django.utils.timezone import localtime
+from django.utils.dateparse import parse_date
+from django.utils.timezone import make_aware
 
 from core.models_audit_db import AuditEventDB
 from core.models import TblArchivoFuente, TblCalificacion
@@ -27,77 +33,99 @@ from core.models import TblArchivoFuente, TblCalificacion
 ORIGEN_MANUAL_TIPO_IDS = {1}   # p.ej. "Corredor"
 ORIGEN_MASIVA_TIPO_IDS = {2}   # p.ej. {2}  "Para Carga Masiva"
 
+logger = logging.getLogger(__name__)
+
 
 # ============================================================================
 # AUTORIZACIÓN
 # ============================================================================
 def _is_analista_o_admin(u):
-    """Permite acceso a superuser, Administrador o AnalistaTributario."""
-    return u.is_superuser or u.groups.filter(
-        name__in=["Administrador", "AnalistaTributario"]
-    ).exists()
+    """
+    Permite acceso a superuser, Administrador o AnalistaTributario.
+    El resultado se memoiza en el usuario (vive lo que dura el request).
+    """
+    cached = getattr(u, "_es_analista_o_admin", None)
+    if cached is None:
+        cached = u.is_superuser or u.groups.filter(
+            name__in=["Administrador", "AnalistaTributario"]
+        ).exists()
+        u._es_analista_o_admin = cached
+    return cached
 
 
 # ============================================================================
 # HELPERS (UI y BD)
 # ============================================================================
-def _badge(op: str):
-    """Etiqueta + color Bootstrap para la operación."""
-    return {
-        "I": ("Añadido",   "success"),
-        "U": ("Modificado","warning"),
-        "D": ("Eliminado", "danger"),
-    }.get(op, (op, "secondary"))
+# Etiqueta + color Bootstrap por operación (op desconocida: (op, "secondary"))
+_BADGE = {
+    "I": ("Añadido",   "success"),
+    "U": ("Modificado","warning"),
+    "D": ("Eliminado", "danger"),
+}
 
 
-def _fetch_calif_ids_by_origen(origen: str) -> set[int]:
+def _tipo_ids_por_origen(origen: str):
     """
-    Devuelve calificacion_id según 'origen':
-    - 'manual' -> tipo_ingreso_id en ORIGEN_MANUAL_TIPO_IDS
-    - 'masiva' -> tipo_ingreso_id en ORIGEN_MASIVA_TIPO_IDS
-    - otro/None -> set() (sin filtro)
+    IDs de TBL_TIPO_INGRESO según 'origen':
+    - 'manual' -> ORIGEN_MANUAL_TIPO_IDS
+    - 'masiva' -> ORIGEN_MASIVA_TIPO_IDS
+    - otro/None -> None (sin filtro)
     """
-    if not origen:
-        return set()
-
     if origen == "manual":
-        tipo_ids = ORIGEN_MANUAL_TIPO_IDS
-    elif origen == "masiva":
-        tipo_ids = ORIGEN_MASIVA_TIPO_IDS
-    else:
-        return set()
-
-    if not tipo_ids:
-        return set()
-
-    placeholders = ", ".join(["%s"] * len(tipo_ids))
-    sql = f'''
-        SELECT c.calificacion_id
-        FROM "TBL_CALIFICACION" c
-        WHERE c.tipo_ingreso_id IN ({placeholders})
-    '''
-    with connection.cursor() as cur:
-        cur.execute(sql, list(tipo_ids))
-        return {row[0] for row in cur.fetchall()}
+        return ORIGEN_MANUAL_TIPO_IDS
+    if origen == "masiva":
+        return ORIGEN_MASIVA_TIPO_IDS
+    return None
 
 
-def _fetch_factor_to_calif_map(factor_ids: list[int]) -> dict[int, int]:
+def _inicio_dia(valor: str, dias: int = 0):
     """
-    Mapa: id(TBL_FACTOR_VALOR) -> calificacion_id.
-    Sirve para agrupar eventos de factores por su calificación.
+    'YYYY-MM-DD' (+dias) -> medianoche local aware; None si viene vacío o
+    no es una fecha válida (se ignora el filtro).
     """
-    if not factor_ids:
-        return {}
-    placeholders = ", ".join(["%s"] * len(factor_ids))
-    sql = f'''
-        SELECT id, calificacion_id
-        FROM "TBL_FACTOR_VALOR"
-        WHERE id IN ({placeholders})
-    '''
-    with connection.cursor() as cur:
-        cur.execute(sql, list(factor_ids))
-        rows = cur.fetchall()
-    return {rid: cid for rid, cid in rows}
+    try:
+        d = parse_date(valor) if valor else None
+    except ValueError:
+        d = None
+    if d is None:
+        return None
+    return make_aware(datetime.combine(d + timedelta(days=dias), time.min))
+
+
+def _eventos_calificacion(op: str, fi: str, ff: str, origen: str):
+    """
+    Queryset único de eventos de calificación/factores, ya filtrado en BD.
+
+    - calif_pk: PK de la calificación. El trigger guarda en row_pk
+      COALESCE(calificacion_id, id), así que tanto TBL_CALIFICACION como
+      TBL_FACTOR_VALOR traen aquí el calificacion_id (no hace falta JOIN).
+      Se lee desde row_pk_int (columna generada e indexada, migración 0009).
+    """
+    q = (
+        AuditEventDB.objects
+        .filter(table_name__in=["TBL_CALIFICACION", "TBL_FACTOR_VALOR"])
+        .annotate(calif_pk=F("row_pk_int"))
+    )
+    if op in ("I", "U", "D"):
+        q = q.filter(op=op)
+    # Rango [fi 00:00, ff+1 00:00) en hora local sobre la columna cruda:
+    # changed_at__date aplicaría AT TIME ZONE + ::date por fila y Postgres no
+    # podría usar ix_audit_events_tabla_fecha (migración 0010).
+    desde = _inicio_dia(fi)
+    if desde:
+        q = q.filter(changed_at__gte=desde)
+    hasta = _inicio_dia(ff, dias=1)
+    if hasta:
+        q = q.filter(changed_at__lt=hasta)
+
+    tipo_ids = _tipo_ids_por_origen(origen)
+    if tipo_ids is not None:
+        q = q.filter(calif_pk__in=Subquery(
+            TblCalificacion.objects
+            .filter(tipo_ingreso_id__in=tipo_ids)
+            .values("calificacion_id")
+        ))
+    return q
 
 
 # ============================================================================
@@ -118,141 +146,111 @@ def auditoria_list(request):
     fi     = request.GET.get("fi", "").strip()           # YYYY-MM-DD
     ff     = request.GET.get("ff", "").strip()           # YYYY-MM-DD
 
-    # Eventos relevantes (calificación y factores)
-    q = AuditEventDB.objects.filter(
-        table_name__in=["TBL_CALIFICACION", "TBL_FACTOR_VALOR"]
+    # Filtros (op/fechas/origen) resueltos en BD
+    q = _eventos_calificacion(op, fi, ff, origen)
+
+    # --- Paginación en BD (10 calificaciones por página) ---
+    # Se paginan los grupos ya agregados en SQL (GROUP BY calif_pk con
+    # primera/última fecha y conteo) y solo se traen los eventos de las
+    # calificaciones de la página pedida. Eventos sin row_pk_int (NULL)
+    # forman su propio grupo "(sin PK)".
+    group_qs = (
+        q.order_by("-calif_pk")
+        .values("calif_pk")
+        .annotate(
+            first_when=Min("changed_at"), last_when=Max("changed_at"), n=Count("id"),
+            title=Case(
+                When(calif_pk__isnull=True, then=Value("Calificación (sin PK)")),
+                default=Concat(Value("Calificación #"), Cast("calif_pk", CharField())),
+                output_field=CharField(),
+            ),
+        )
     )
-    if op in ("I", "U", "D"):
-        q = q.filter(op=op)
-    if fi:
-        q = q.filter(changed_at__date__gte=fi)
-    if ff:
-        q = q.filter(changed_at__date__lte=ff)
-    q = q.order_by("-changed_at")
-
-    # Límite defensivo para evitar respuestas gigantes
-    base_rows = list(q[:4000])
-
-    # Si hay filtro por origen, obtén calificaciones válidas
-    calif_ids_ok = _fetch_calif_ids_by_origen(origen) if origen else set()
-
-    # ------------------------------------------------------------------ #
-    # 1) Determinar TODAS las calificaciones afectadas (para ver si
-    #    tienen archivo y si son de carga masiva).
-    # ------------------------------------------------------------------ #
-    calif_ids_all: set[int] = set()
-    for e in base_rows:
-        if e.table_name == "TBL_CALIFICACION":
-            try:
-                calif_ids_all.add(int(e.row_pk))
-            except (TypeError, ValueError):
-                pass
-
-    # Mapa de factor -> calificación (para agrupar correctamente)
-    factor_ids = [int(e.row_pk) for e in base_rows if e.table_name == "TBL_FACTOR_VALOR"]
-    f2c = _fetch_factor_to_calif_map(factor_ids)
-
-    # Los factores también apuntan a calificaciones
-    calif_ids_all.update(f2c.values())
-
-    # Bulk query: info de archivo/tipo_ingreso por calificación
-    calif_fileinfo: dict[int, dict] = {}
-    if calif_ids_all:
-        for cid, archivo_fuente_id, tipo_ingreso_id in TblCalificacion.objects.filter(
-            calificacion_id__in=calif_ids_all
-        ).values_list("calificacion_id", "archivo_fuente_id", "tipo_ingreso_id"):
-            calif_fileinfo[cid] = {
-                "has_file": archivo_fuente_id is not None,
-                "is_masiva": tipo_ingreso_id in ORIGEN_MASIVA_TIPO_IDS,
-            }
-
-    # Normaliza filas para la UI
-    rows = []
-    for e in base_rows:
-        # Aplica filtro de origen
-        if origen:
-            if e.table_name == "TBL_CALIFICACION":
-                if int(e.row_pk) not in calif_ids_ok:
-                    continue
-                pk_visible = e.row_pk
-            else:  # TBL_FACTOR_VALOR
-                calif_id = f2c.get(int(e.row_pk))
-                if calif_id is None or calif_id not in calif_ids_ok:
-                    continue
-                pk_visible = calif_id
-        else:
-            # Sin filtro de origen: para FACTOR, muestra su calificación
-            if e.table_name == "TBL_FACTOR_VALOR":
-                pk_visible = f2c.get(int(e.row_pk), "—")
-            else:
-                pk_visible = e.row_pk
-
-        label, color = _badge(e.op)
-
-        # ¿Esta fila corresponde a una calificación con archivo masivo?
-        has_archivo = False
-        try:
-            cid_int = int(pk_visible)
-        except (TypeError, ValueError):
-            cid_int = None
-
-        if cid_int is not None:
-            info = calif_fileinfo.get(cid_int)
-            if info and info["has_file"] and info["is_masiva"]:
-                has_archivo = True
-
-        rows.append({
-            "pk": pk_visible,
-            "table": e.table_name,
-            "op": e.op,
-            "op_label": label,
-            "op_color": color,
-            "actor": e.app_user or "—",
-            "db_user": e.db_user,
-            "ip": e.client_ip or "—",
-            "rid": e.request_id or "—",
-            "when": localtime(e.changed_at),
-            "before": json.dumps(e.before_row, ensure_ascii=False, indent=2, sort_keys=True) if e.before_row else "",
-            "after":  json.dumps(e.after_row,  ensure_ascii=False, indent=2, sort_keys=True) if e.after_row  else "",
-            "has_archivo": has_archivo,  # 👈 flag para el template
-        })
-
-    # --- Métricas (sobre 'rows' ya filtradas) ---
-    total_ops = len(rows)
-    count_I   = sum(1 for r in rows if r["op"] == "I")
-    count_U   = sum(1 for r in rows if r["op"] == "U")
-    count_D   = sum(1 for r in rows if r["op"] == "D")
-    active_users = sorted({r["actor"] for r in rows if r["actor"] and r["actor"] != "—"})
-    active_users_count = len(active_users)
+    paginator   = Paginator(group_qs, 10)
+    page_number = request.GET.get("page")
+    page_obj    = paginator.get_page(page_number)
+    page_groups = list(page_obj.object_list)
+    page_keys   = [g["calif_pk"] for g in page_groups]
+    # IN (...) nunca calza con NULL: el grupo sin PK se pide aparte
+    en_pagina = Q(calif_pk__in=[k for k in page_keys if k is not None])
+    if None in page_keys:
+        en_pagina |= Q(calif_pk__isnull=True)
+
+    con_archivo = TblCalificacion.objects.filter(
+        calificacion_id=OuterRef("calif_pk"),
+        archivo_fuente__isnull=False,
+        tipo_ingreso_id__in=ORIGEN_MASIVA_TIPO_IDS,
+    )
+    page_events = (
+        q.filter(en_pagina)
+        .annotate(has_archivo=Exists(con_archivo))
+        .order_by("changed_at")  # timeline ASC dentro de cada grupo
+        .values(
+            "calif_pk", "changed_at", "table_name", "op", "db_user", "app_user",
+            "request_id", "client_ip", "before_row", "after_row", "has_archivo",
+        )
+        .iterator(chunk_size=500)
+    ) if page_keys else []
+
+    # Normaliza filas para la UI (dicts de .values(), sin instancias ORM)
+    rows = [
+        {
+            "pk": e["calif_pk"],
+            "table": e["table_name"],
+            "op": e["op"],
+            "op_label": (badge := _BADGE.get(e["op"], (e["op"], "secondary")))[0],
+            "op_color": badge[1],
+            "actor": e["app_user"] or "—",
+            "db_user": e["db_user"],
+            "ip": e["client_ip"] or "—",
+            "rid": e["request_id"] or "—",
+            "when": e["changed_at"],  # aware UTC; el template aplica |localtime
+            "before": e["before_row"],  # JSON crudo; se formatea en el template (pretty_json)
+            "after":  e["after_row"],
+            "has_archivo": e["has_archivo"],  # 👈 flag para el template
+        }
+        for e in page_events
+    ]
 
     # --- Agrupación por Calificación (PK) ---
-    keyfunc       = lambda r: r["pk"]
-    group_title   = lambda k: f"Calificación #{k}"
-    empty_key_lbl = "Calificación (sin PK)"
-
-    # Orden estable: por PK (str) y luego por fecha DESC (para groupby)
-    rows_sorted = sorted(
-        rows,
-        key=lambda r: (str(keyfunc(r) or ""), -r["when"].timestamp())
-    )
+    # Una pasada a buckets; los grupos salen en el orden de la página
+    buckets = defaultdict(list)
+    for r in rows:
+        buckets[r["pk"]].append(r)
 
     groups = []
-    for gkey, items_iter in groupby(rows_sorted, keyfunc):
-        items = list(items_iter)
-        items.sort(key=lambda r: r["when"])  # timeline ASC dentro del grupo
+    for g in page_groups:
+        gkey = g["calif_pk"]
         groups.append({
-            "key": gkey or empty_key_lbl,
-            "title": group_title(gkey or empty_key_lbl),
-            "first_when": items[0]["when"] if items else None,
-            "last_when":  items[-1]["when"] if items else None,
-            "count": len(items),
-            "items": items,
+            "key": gkey,
+            "title": g["title"],
+            "first_when": g["first_when"],
+            "last_when":  g["last_when"],
+            "count": g["n"],
+            "items": buckets.get(gkey, []),
         })
-
-    # --- Paginación (10 grupos por página) ---
-    paginator   = Paginator(groups, 10)
-    page_number = request.GET.get("page")
-    page_obj    = paginator.get_page(page_number)
+    page_obj.object_list = groups
+
+    # --- Métricas (agregadas en BD sobre todo el resultado filtrado) ---
+    # Un solo agregado con COUNT(*) FILTER (WHERE op = ...) por tipo
+    stats = q.order_by().aggregate(
+        total=Count("id"),
+        count_I=Count("id", filter=Q(op="I")),
+        count_U=Count("id", filter=Q(op="U")),
+        count_D=Count("id", filter=Q(op="D")),
+    )
+    total_ops = stats["total"]
+    count_I   = stats["count_I"]
+    count_U   = stats["count_U"]
+    count_D   = stats["count_D"]
+    actores = (
+        q.exclude(app_user__isnull=True).exclude(app_user="")
+        .order_by("app_user")
+        .values_list("app_user", flat=True)
+        .distinct()
+    )
+    active_users_count = actores.count()
+    active_users = list(actores[:8])  # top visibles
 
     context = {
         "page_obj": page_obj,
@@ -265,7 +263,7 @@ def auditoria_list(request):
         "count_U": count_U,
         "count_D": count_D,
         "active_users_count": active_users_count,
-        "active_users": active_users[:8],  # top visibles
+        "active_users": active_users,
     }
     return render(request, "auditoria/lista_log.html", context)
 
@@ -273,6 +271,16 @@ def auditoria_list(request):
 # ============================================================================
 # DESCARGAR ARCHIVO FUENTE (S3 / legacy)
 # ============================================================================
+DOWNLOAD_BLOCK_SIZE = 8 * 1024 * 1024  # 8 MiB por chunk (default de Django: 4 KiB)
+
+
+def _file_response(f, filename: str) -> FileResponse:
+    """FileResponse de descarga con bloques grandes (menos iteraciones/llamadas)."""
+    resp = FileResponse(f, as_attachment=True, filename=filename)
+    resp.block_size = DOWNLOAD_BLOCK_SIZE
+    return resp
+
+
 @login_required(login_url="login")
 @user_passes_test(_is_analista_o_admin)
 def descargar_archivo_fuente(request, calificacion_id: int):
@@ -284,28 +292,28 @@ def descargar_archivo_fuente(request, calificacion_id: int):
     - Si no, intenta reconstruir la key desde `ruta_almacenamiento` (legacy).
     """
     # 1) Buscar la calificación
-    calif = get_object_or_404(TblCalificacion, pk=calificacion_id)
+    calif = get_object_or_404(
+        TblCalificacion.objects.select_related("archivo_fuente"), pk=calificacion_id
+    )
 
     # 2) Tomar el archivo fuente asociado
     af = calif.archivo_fuente
     if af is None:
         raise Http404("No existe archivo fuente asociado a esta calificación.")
 
-    # DEBUG opcional
-    print("DEBUG descargar_archivo_fuente: calificacion_id =", calificacion_id)
-    print("  archivo_fuente_id:", af.archivo_fuente_id)
-    print("  archivo.name:", getattr(af.archivo, "name", None))
-    print("  ruta_almacenamiento:", af.ruta_almacenamiento)
+    # DEBUG opcional (sin costo si el nivel de log es INFO o superior)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "descargar_archivo_fuente calif=%s af=%s name=%s ruta=%s",
+            calificacion_id, af.archivo_fuente_id,
+            getattr(af.archivo, "name", None), af.ruta_almacenamiento,
+        )
 
     # --- Caso 1: FileField (nuevo flujo con S3) ---
     if getattr(af, "archivo", None) and af.archivo.name:
         f = af.archivo.open("rb")  # usa S3Boto3Storage
         filename = af.nombre_archivo or os.path.basename(af.archivo.name)
-        return FileResponse(
-            f,
-            as_attachment=True,
-            filename=filename,
-        )
+        return _file_response(f, filename)
 
     # --- Caso 2: sólo tenemos la URL en ruta_almacenamiento (legacy) ---
     if af.ruta_almacenamiento:
@@ -320,13 +328,9 @@ def descargar_archivo_fuente(request, calificacion_id: int):
             try:
                 f = default_storage.open(key, "rb")
                 filename = af.nombre_archivo or os.path.basename(key)
-                return FileResponse(
-                    f,
-                    as_attachment=True,
-                    filename=filename,
-                )
-            except Exception as ex:
-                print("DEBUG error abriendo archivo legacy desde S3:", ex)
+                return _file_response(f, filename)
+            except Exception:
+                logger.exception("Error abriendo archivo legacy desde S3 (key=%s)", key)
 
     # Si llegamos aquí, realmente no tenemos cómo resolver el archivo
     raise Http404("Este registro no tiene archivo asociado")
@@ -3,45 +3,200 @@ from __future__ import annotations
 # ============================================================================
 # IMPORTS
 # ============================================================================
+import hashlib
+import logging
 import os
+import uuid
+from datetime import datetime
 from io import TextIOWrapper, BytesIO
 from decimal import Decimal as D
 
 import pdfplumber
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from django.db import transaction
-from django.shortcuts import render, redirect
+from django.db import DatabaseError, connection, transaction
+from django.core.paginator import Paginator
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.timezone import localtime
 
 from core.models import (
-    TblCalificacion, TblFactorValor, TblArchivoFuente, TblTipoIngreso
+    TblCalificacion, TblFactorValor, TblArchivoFuente, TblImportError
 )
 
-from core.views.mainv import _round8, _build_def_map, POS_MIN, POS_BASE_MAX, POS_MAX
+from core.views.mainv import (
+    _build_def_map, _decimal_fuera_de_rango, _factores8_int, _montos_a_enteros,
+    _MONTO_BASE, POS_MIN, POS_BASE_MAX, POSICIONES, POSICIONES_BASE, ZERO, UNO,
+)
 from core.ingestion_helpers import (
     to_int, to_dec, is_monto_col, is_factor_col,
-    find_mercado, tipo_ingreso_by_id,
+    find_mercado, tipo_ingreso_by_id, default_tipo_ingreso,
+    _mercados_catalogo, _tipos_ingreso_catalogo,
     parse_csv, parse_cert70_text, annotate_preview
 )
 
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # SESIÓN (claves usadas para la vista previa)
 # ============================================================================
-SESSION_ROWS = "upload_preview_rows"      # lista de filas normalizadas
-SESSION_MODE = "upload_mode"              # "montos" | "factors"
-SESSION_META = "upload_meta"              # {"nombre":..., "tipo":"csv"|"pdf"}
-SESSION_FILE = "upload_file_content"      # contenido del archivo en bytes (para subir después)
+# Una sola clave: {"token": <filas + archivo en caché "uploads">,
+#                  "modo": "montos"|"factors",
+#                  "meta": {"nombre":..., "tipo":"csv"|"pdf"}}
+SESSION_UPLOAD = "upload_preview"
+
+# Caché compartida entre workers para filas y bytes del preview (ver settings.CACHES)
+upload_cache = ConnectionProxy(caches, "uploads")
+# Parseos de PDF por hash: alias propio, no compiten con los previews
+pdf_cache = ConnectionProxy(caches, "pdf_parse")
+
+# Tamaño de lote para escrituras masivas (bulk_create / bulk_update);
+# configurable con CALIF_BULK_BATCH_SIZE (ver settings)
+BULK_BATCH_SIZE = settings.CALIF_BULK_BATCH_SIZE
+# Upsert de factores: múltiplo de las 30 posiciones, para que los factores de
+# una calificación nunca queden en dos sentencias (el trigger de suma 8..19
+# valida al terminar cada sentencia)
+FACTOR_BATCH_SIZE = max(1, BULK_BATCH_SIZE // len(POSICIONES)) * len(POSICIONES)
+
+# Campos que un re-import refresca en calificaciones ya existentes
+CAMPOS_REFRESCO = [
+    "mercado", "instrumento_text", "tipo_ingreso", "descripcion",
+    "fecha_pago_dividendo", "usuario", "archivo_fuente", "row_hash",
+]
+
+# Columnas (attname: FK como *_id) de CAMPOS_REFRESCO, para detectar cambios
+_ATTS_REFRESCO = [TblCalificacion._meta.get_field(f).attname for f in CAMPOS_REFRESCO]
+
+# Campo de fecha: se usa su to_python() para validar la fecha por fila
+_FECHA_PAGO = TblCalificacion._meta.get_field("fecha_pago_dividendo")
+
+# Límites de las columnas que escribe la carga: un valor que no cabe haría
+# fallar el lote completo con DataError, así que se valida por fila.
+_MAX_INSTRUMENTO = TblCalificacion._meta.get_field("instrumento_text").max_length
+_MAX_DESCRIPCION = TblCalificacion._meta.get_field("descripcion").max_length
+_DECIMALES_CABECERA = {
+    nombre: TblCalificacion._meta.get_field(nombre)
+    for nombre in ("dividendo", "factor_actualizacion")
+}
+_VALOR = TblFactorValor._meta.get_field("valor")
+INT_MAX = 2 ** 31 - 1   # columnas integer de Postgres
 
 
 # ============================================================================
 # HELPERS LOCALES
 # ============================================================================
+def _file_cache_key(token: str) -> str:
+    return f"upload:file:{token}"
+
+
+def _pdf_cache_key(file_hash: str) -> str:
+    return f"upload:pdf:{file_hash}"
+
+
+def _delete_preview(token: str) -> None:
+    upload_cache.delete(_file_cache_key(token))
+
+
+def _preview_token(request) -> str | None:
+    return (request.session.get(SESSION_UPLOAD) or {}).get("token")
+
+
+def _store_preview(request, file_content: bytes, modo: str, meta: dict) -> None:
+    """
+    Guarda los bytes del archivo en la caché 'uploads' (las filas se
+    re-parsean al confirmar); en sesión queda un único dict chico.
+    """
+    old_token = _preview_token(request)
+    if old_token:
+        _delete_preview(old_token)
+    token = uuid.uuid4().hex
+    upload_cache.set(_file_cache_key(token), file_content)
+    request.session[SESSION_UPLOAD] = {"token": token, "modo": modo, "meta": meta}
+
+
+def _load_preview_file(request) -> bytes | None:
+    """Bytes del archivo subido en el preview (None si expiró o no hay)."""
+    token = _preview_token(request)
+    if not token:
+        return None
+    return upload_cache.get(_file_cache_key(token))
+
+
 def _clear_upload_session(request) -> None:
-    """Borra las claves de sesión usadas para la carga/preview."""
-    for key in (SESSION_ROWS, SESSION_MODE, SESSION_META, SESSION_FILE):
-        request.session.pop(key, None)
+    """Borra la clave de sesión (y el archivo en caché) usada para la carga/preview."""
+    token = _preview_token(request)
+    if token:
+        _delete_preview(token)
+    request.session.pop(SESSION_UPLOAD, None)
+
+
+def _refrescar_calificacion(calif, campos: dict, usuario, archivo_fuente) -> None:
+    """Re-import: refresca en memoria los campos básicos (ver CAMPOS_REFRESCO)."""
+    calif.mercado = campos["mercado"]
+    calif.instrumento_text = campos["instrumento_text"]
+    calif.tipo_ingreso = campos["tipo_ingreso"]
+    calif.descripcion = campos["descripcion"]
+    if campos["fecha_pago_dividendo"]:
+        calif.fecha_pago_dividendo = campos["fecha_pago_dividendo"]
+    calif.usuario = usuario
+    calif.archivo_fuente = archivo_fuente
+    calif.row_hash = campos["row_hash"]
+
+
+def _row_hash(clave, campos: dict, factores: dict, usuario, archivo_fuente) -> str:
+    """
+    Huella SHA256 de lo que un re-import escribe: exactamente los campos de
+    _refrescar_calificacion (incluidos usuario y archivo fuente) y los
+    factores 8..37. Igual huella que la grabada = re-import idempotente, se
+    omite. Un archivo distinto con las mismas filas sí re-apunta la
+    calificación a ese archivo.
+    """
+    tipo = campos["tipo_ingreso"]
+    h = hashlib.sha256(repr((
+        clave,
+        campos["mercado"].pk,
+        campos["instrumento_text"],
+        tipo.pk if tipo else None,
+        campos["descripcion"],
+        campos["fecha_pago_dividendo"],
+        usuario.pk,
+        archivo_fuente.pk,
+    )).encode())
+    for pos in POSICIONES:
+        h.update(repr(factores[pos]).encode())
+    return h.hexdigest()
+
+
+def _error_de_rango(clave, campos: dict, factores: dict) -> str | None:
+    """
+    Mensaje de error si algún valor de la fila no cabe en su columna
+    (clave, instrumento, decimales de cabecera y factores); None si cabe.
+    """
+    for nombre, valor in zip(("ejercicio", "secuencia_evento"), clave):
+        if abs(valor) > INT_MAX:
+            return f"{nombre} fuera de rango ({valor})."
+    if len(campos["instrumento_text"]) > _MAX_INSTRUMENTO:
+        return f"instrumento supera {_MAX_INSTRUMENTO} caracteres."
+    for nombre, field in _DECIMALES_CABECERA.items():
+        if _decimal_fuera_de_rango(campos[nombre], field):
+            return f"{nombre} fuera de rango ({campos[nombre]})."
+    for pos, (monto_base, valor) in factores.items():
+        if _decimal_fuera_de_rango(monto_base, _MONTO_BASE):
+            return f"monto F{pos} fuera de rango ({monto_base})."
+        if _decimal_fuera_de_rango(valor, _VALOR):
+            return f"factor F{pos} fuera de rango ({valor})."
+    return None
+
+
+def _valores_refresco(calif) -> tuple:
+    """Valores actuales de CAMPOS_REFRESCO (FKs por id: no dispara consultas)."""
+    return tuple(getattr(calif, att) for att in _ATTS_REFRESCO)
 
 
 def _ext(fname: str) -> str:
@@ -49,6 +204,29 @@ def _ext(fname: str) -> str:
     return os.path.splitext(fname.lower())[1]
 
 
+def _parse_upload(file_content: bytes, tipo_archivo: str, file_hash: str | None = None):
+    """
+    Parsea los bytes subidos (CSV o PDF Cert70). Devuelve (rows, modo).
+    PDF: el resultado se cachea por hash de contenido, así confirmar (o volver
+    a subir el mismo archivo) no repite la pasada de pdfplumber.
+    """
+    # --- CSV ---
+    if tipo_archivo == "csv":
+        wrapper = TextIOWrapper(BytesIO(file_content), encoding="utf-8", newline="")
+        rows, modo = parse_csv(wrapper)
+        wrapper.detach()
+        return rows, modo
+
+    # --- PDF (Certificado 70): file-like desde bytes para pdfplumber ---
+    file_hash = file_hash or hashlib.sha256(file_content).hexdigest()
+    key = _pdf_cache_key(file_hash)
+    parsed = pdf_cache.get(key)
+    if parsed is None:
+        parsed = parse_cert70_text(BytesIO(file_content))
+        pdf_cache.set(key, parsed)
+    return parsed
+
+
 # ============================================================================
 # SUBIDA + VALIDACIÓN (CSV / PDF)
 # ============================================================================
@@ -61,7 +239,7 @@ def carga_archivo(request):
     Flujo NUEVO:
       1. Lee y parsea el archivo (CSV o PDF)
       2. Valida el contenido
-      3. Guarda el contenido en SESIÓN (no en S3 todavía)
+      3. Guarda el archivo en la caché "uploads" (no en S3 todavía)
       4. Muestra vista previa
       5. Solo cuando el usuario confirma en carga_confirmar(), se sube a S3
     
@@ -81,57 +259,40 @@ def carga_archivo(request):
         tipo_archivo = "csv" if ext == ".csv" else "pdf"
 
         try:
-            # Leer todo el contenido del archivo a memoria
-            if hasattr(upload, "seek"):
-                upload.seek(0)
-            file_content = upload.read()
-            
-            # Volver al inicio para procesamiento
-            if hasattr(upload, "seek"):
-                upload.seek(0)
-
-            # --- CSV ---
-            if ext == ".csv":
-                wrapper = TextIOWrapper(BytesIO(file_content), encoding="utf-8", newline="")
-                rows, modo = parse_csv(wrapper)
-                wrapper.detach()
-
-            # --- PDF (Certificado 70) ---
-            else:
-
-                
-                # Crear un objeto file-like desde bytes para pdfplumber
-                pdf_file_like = BytesIO(file_content)
-                rows, modo = parse_cert70_text(pdf_file_like)
+            # Leer el archivo por chunks, calculando el SHA256 en la misma
+            # pasada (se reutiliza al confirmar para detectar duplicados)
+            sha = hashlib.sha256()
+            partes = []
+            for chunk in upload.chunks():
+                sha.update(chunk)
+                partes.append(chunk)
+            file_content = b"".join(partes)
+            file_hash = sha.hexdigest()
+            rows, modo = _parse_upload(file_content, tipo_archivo, file_hash)
 
             # Debe haber filas válidas
             if not rows:
-                print("DEBUG: No se detectaron filas válidas")
                 messages.warning(request, "No se detectaron filas válidas.")
                 return render(request, "calificaciones/carga_archivo.html")
 
-            # Anota errores/advertencias y campos auxiliares para el preview
-            annotate_preview(rows, modo)
-
-            # Guardamos datos en sesión para la confirmación
-            # IMPORTANTE: Guardamos el contenido del archivo en sesión (en formato base64 o bytes)
-            import base64
-            request.session[SESSION_FILE] = base64.b64encode(file_content).decode('utf-8')
-            request.session[SESSION_ROWS] = rows
-            request.session[SESSION_MODE] = modo
-            request.session[SESSION_META] = {
-                "nombre": fname,
-                "tipo": tipo_archivo,
-            }
-            request.session.modified = True
+            # Anota errores/advertencias y campos auxiliares para el preview;
+            # los conteos salen de la misma pasada
+            errores, advertencias = annotate_preview(rows, modo)
 
             # Métricas rápidas para mostrar en la vista previa
             total = len(rows)
-            errores = sum(1 for r in rows if r.get("pre_error"))
-            advertencias = sum(1 for r in rows if r.get("pre_warning"))
             validos = total - errores - advertencias
             can_import = (errores == 0)
 
+            # Guardamos solo el archivo (caché 'uploads') y contadores en sesión
+            _store_preview(request, file_content, modo, {
+                "nombre": fname,
+                "tipo": tipo_archivo,
+                "total": total,
+                "errores": errores,
+                "hash": file_hash,
+            })
+
             return render(request, "calificaciones/carga_archivo.html", {
                 "preview_rows": rows[:5],        # solo un vistazo
                 "modo_detectado": modo,          # "montos" | "factors"
@@ -149,9 +310,7 @@ def carga_archivo(request):
 
         except Exception as ex:
             # Cualquier error durante el parseo
-            print(f"DEBUG ERROR: {ex}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error al procesar archivo %s", fname)
             messages.error(request, f"Error al procesar archivo: {ex}")
             return render(request, "calificaciones/carga_archivo.html")
 
@@ -163,6 +322,137 @@ def carga_archivo(request):
     })
 
 
+# ============================================================================
+# ESCRITURA POR LOTES (una transacción por lote)
+# ============================================================================
+def _copy_factores(factores) -> None:
+    """
+    Inserta factores con COPY ... FROM STDIN (psycopg3): sin el parseo de
+    INSERTs multi-fila. Solo para calificaciones recién creadas (sin
+    conflictos posibles). Los triggers (auditoría, suma 8..19) se disparan
+    igual que con INSERT.
+    """
+    factores = list(factores)
+    if not factores:
+        return
+    opts = TblFactorValor._meta
+    campos = [opts.get_field(f) for f in ("calificacion", "posicion", "monto_base", "valor", "factor_def")]
+    columnas = ", ".join(connection.ops.quote_name(f.column) for f in campos)
+    sql = f"COPY {connection.ops.quote_name(opts.db_table)} ({columnas}) FROM STDIN"
+    # wrap_database_errors: errores de psycopg -> django.db (IntegrityError, ...)
+    with connection.cursor() as cur, connection.wrap_database_errors, cur.copy(sql) as copy:
+        for fv in factores:
+            copy.write_row([
+                f.get_db_prep_save(getattr(fv, f.attname), connection) for f in campos
+            ])
+
+
+def _importar_lote(preparadas, usuario, archivo_fuente, def_ids):
+    """
+    Escribe un lote de filas preparadas en su propia transacción.
+    preparadas: [(fila, (ejercicio, sec_eve), campos, factores)]; todas las filas
+    de una misma clave vienen en el mismo lote. def_ids: {pos: pk TblFactorDef}.
+    Devuelve (creados, actualizados, sin_cambios, omitidos, errores), con
+    errores como [(fila, mensaje)]. Si la BD rechaza el lote (p.ej. trigger de
+    suma 8..19) lanza DatabaseError y solo ese lote se revierte.
+    """
+    created = updated = sin_cambios = skipped = 0
+    errores: list[tuple[int | None, str]] = []
+
+    with transaction.atomic():
+        # Calificaciones existentes para las claves del lote (1 consulta;
+        # clave de negocio: ejercicio + secuencia_evento)
+        claves = {clave for _, clave, _, _ in preparadas}
+        existentes: dict[tuple[int, int], TblCalificacion] = {}
+        if claves:
+            # Solo la clave y lo que bulk_update re-escribe (CAMPOS_REFRESCO).
+            # FOR UPDATE en orden de pk: dos cargas que se solapan se
+            # serializan por fila sin deadlock (bloquean siempre en el mismo orden).
+            candidatas = TblCalificacion.objects.select_for_update().filter(
+                ejercicio__in={e for e, _ in claves},
+                secuencia_evento__in={s for _, s in claves},
+            ).only(
+                "ejercicio", "secuencia_evento", *CAMPOS_REFRESCO
+            ).order_by("pk")
+            for c in candidatas:
+                clave = (c.ejercicio, c.secuencia_evento)
+                if clave in claves:
+                    existentes.setdefault(clave, c)
+
+        nuevas: dict[tuple[int, int], TblCalificacion] = {}
+        a_actualizar: dict[tuple[int, int], TblCalificacion] = {}
+        filas_ok = []   # (clave, factores) en orden del archivo
+
+        for i, clave, campos, factores in preparadas:
+            calif = existentes.get(clave) or nuevas.get(clave)
+
+            if calif is None:
+                # Nueva: se crea con todos los campos del archivo
+                if not campos["fecha_pago_dividendo"]:
+                    skipped += 1
+                    errores.append((i, "falta la fecha de pago para crear la calificación."))
+                    continue
+                nuevas[clave] = TblCalificacion(
+                    ejercicio=clave[0],
+                    secuencia_evento=clave[1],
+                    usuario=usuario,
+                    archivo_fuente=archivo_fuente,
+                    **campos,
+                )
+                created += 1
+            elif calif.row_hash == campos["row_hash"]:
+                # Misma huella que lo ya grabado (o que la fila anterior de
+                # esta clave): nada que escribir
+                sin_cambios += 1
+                continue
+            else:
+                # Ya existía (en BD o antes en el archivo): refresca campos básicos.
+                # Si nada cambió (re-import del mismo archivo) no se re-escribe.
+                antes = _valores_refresco(calif)
+                _refrescar_calificacion(calif, campos, usuario, archivo_fuente)
+                if calif.pk and _valores_refresco(calif) != antes:
+                    a_actualizar[clave] = calif
+                updated += 1
+
+            filas_ok.append((clave, factores))
+
+        TblCalificacion.objects.bulk_create(list(nuevas.values()), batch_size=BULK_BATCH_SIZE)
+        TblCalificacion.objects.bulk_update(
+            list(a_actualizar.values()), CAMPOS_REFRESCO, batch_size=BULK_BATCH_SIZE
+        )
+
+        # Factores. Dict por (calificación, posición): si el archivo repite
+        # una calificación, gana la última fila (igual que antes).
+        #   - calificaciones nuevas: no pueden tener factores previos -> COPY
+        #   - existentes: upsert (INSERT ... ON CONFLICT DO UPDATE)
+        factores_nuevas: dict[tuple, TblFactorValor] = {}
+        factores_existentes: dict[tuple, TblFactorValor] = {}
+        for clave, factores in filas_ok:
+            calif = existentes.get(clave)
+            destino = factores_existentes
+            if calif is None:
+                calif, destino = nuevas[clave], factores_nuevas
+            for pos, (monto_base, valor) in factores.items():
+                # FKs como ids: sin pasar por el descriptor de relación por factor
+                destino[(clave, pos)] = TblFactorValor(
+                    calificacion_id=calif.pk,
+                    posicion=pos,
+                    monto_base=monto_base,
+                    valor=valor,
+                    factor_def_id=def_ids.get(pos),
+                )
+        _copy_factores(factores_nuevas.values())
+        TblFactorValor.objects.bulk_create(
+            list(factores_existentes.values()),
+            batch_size=FACTOR_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["calificacion", "posicion"],
+            update_fields=["monto_base", "valor", "factor_def"],
+        )
+
+    return created, updated, sin_cambios, skipped, errores
+
+
 # ============================================================================
 # CONFIRMAR IMPORTACIÓN (persiste datos en BD)
 # ============================================================================
@@ -170,7 +460,7 @@ def carga_archivo(request):
 @permission_required("core.add_tblcalificacion", raise_exception=True)
 def carga_confirmar(request):
     """
-    Importa definitivamente las filas de la vista previa (desde sesión).
+    Importa definitivamente las filas de la vista previa (re-parsea el archivo en caché).
     
     Flujo NUEVO:
       1. Valida que no hay errores
@@ -187,57 +477,59 @@ def carga_confirmar(request):
     if request.method != "POST":
         return redirect("carga_archivo")
 
-    rows = request.session.get(SESSION_ROWS) or []
-    modo = request.session.get(SESSION_MODE) or "montos"
-    meta = request.session.get(SESSION_META) or {}
-    file_content_b64 = request.session.get(SESSION_FILE)
-
-    if rows:
-        print(f"DEBUG CONFIRMAR: Primera fila keys: {list(rows[0].keys())}")
-        print(f"DEBUG CONFIRMAR: Primera fila data: {rows[0]}")
+    preview = request.session.get(SESSION_UPLOAD) or {}
+    modo = preview.get("modo") or "montos"
+    meta = preview.get("meta") or {}
+    file_content = _load_preview_file(request)
 
-    # Debe existir preview en sesión
-    if not rows:
+    # Debe existir preview en sesión (y su archivo en caché)
+    if not file_content:
         messages.error(request, "No hay vista previa en sesión.")
         return redirect("carga_archivo")
 
     # Servidor bloquea si quedaron errores en la validación previa
-    if any(r.get("pre_error") for r in rows):
+    if meta.get("errores"):
         messages.error(request, "No se puede importar: existen registros con errores en la validación.")
         return redirect("carga_archivo")
 
-    # Debe existir el contenido del archivo en sesión
-    if not file_content_b64:
-        messages.error(request, "No se encontró el archivo en sesión.")
+    # Re-parsea el archivo del preview (mismas filas y anotaciones que se mostraron)
+    try:
+        rows, _ = _parse_upload(file_content, meta.get("tipo"), meta.get("hash"))
+        annotate_preview(rows, modo)
+    except Exception as ex:
+        messages.error(request, f"Error al procesar archivo: {ex}")
+        return redirect("carga_archivo")
+
+    if rows and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("CONFIRMAR: primera fila keys=%s", list(rows[0].keys()))
+        logger.debug("CONFIRMAR: primera fila data=%s", rows[0])
+
+    if not rows:
+        messages.error(request, "No hay vista previa en sesión.")
         return redirect("carga_archivo")
 
     # ============================================================================
     # PASO 1: VERIFICAR DUPLICIDAD Y SUBIR ARCHIVO A S3
     # ============================================================================
     try:
-        import base64
-        import hashlib
-        from datetime import datetime
-        
-        file_content = base64.b64decode(file_content_b64)
         fname = meta.get("nombre", "upload")
         
-        # Calcular hash SHA256 del contenido
-        file_hash = hashlib.sha256(file_content).hexdigest()
+        # Hash SHA256 calculado al subir
+        file_hash = meta["hash"]
         
-        # Buscar si ya existe un archivo con el mismo hash
-        archivo_existente = TblArchivoFuente.objects.filter(
-            hash_contenido=file_hash
-        ).first()
+        # Buscar si ya existe un archivo con el mismo hash (solo se usan
+        # la PK, como FK de las calificaciones, y la fecha para el aviso)
+        archivo_existente = TblArchivoFuente.objects.only(
+            "archivo_fuente_id", "fecha_subida"
+        ).filter(hash_contenido=file_hash).first()
         
         if archivo_existente:
             # Archivo duplicado encontrado - reutilizar
             archivo_fuente = archivo_existente
-            print(f": Archivo duplicado encontrado (ID: {archivo_fuente.archivo_fuente_id})")
+            logger.info("Archivo duplicado encontrado (ID: %s)", archivo_fuente.archivo_fuente_id)
             
-            # Convertir UTC a hora Chile (restar 3 horas)
-            from datetime import timedelta
-            fecha_chile = archivo_fuente.fecha_subida - timedelta(hours=3)
+            # UTC -> hora local (TIME_ZONE, con horario de verano)
+            fecha_chile = localtime(archivo_fuente.fecha_subida)
             
             messages.info(
                 request, 
@@ -260,14 +552,21 @@ def carga_confirmar(request):
             except Exception:
                 file_url = s3_key
             
-            # Crear registro de archivo fuente
-            archivo_fuente = TblArchivoFuente.objects.create(
-                nombre_archivo=fname,
-                ruta_almacenamiento=file_url,
+            # Crear registro de archivo fuente (get_or_create: el índice único
+            # de hash_contenido resuelve la carrera entre dos confirmaciones)
+            archivo_fuente, creado = TblArchivoFuente.objects.get_or_create(
                 hash_contenido=file_hash,
-                tamanio_bytes=len(file_content),
-                usuario=request.user,
+                defaults={
+                    "nombre_archivo": fname,
+                    "ruta_almacenamiento": file_url,
+                    "tamanio_bytes": len(file_content),
+                    "usuario": request.user,
+                },
             )
+            if not creado:
+                # Otra confirmación concurrente lo registró primero: se
+                # reutiliza ese registro y se descarta la copia recién subida
+                default_storage.delete(s3_key)
                     
     except Exception as ex:
         messages.error(request, f"Error al procesar archivo: {ex}")
@@ -276,150 +575,213 @@ def carga_confirmar(request):
     # ============================================================================
     # PASO 2: PROCESAR Y GUARDAR CALIFICACIONES EN BD
     # ============================================================================
-    def_map = _build_def_map()   # Catálogo {pos: TblFactorDef}
-    created = updated = skipped = 0
-    errores: list[str] = []
+    # Catálogo {pos: TblFactorDef} -> {pos: pk}: los factores solo necesitan la FK
+    def_ids = {pos: d.pk for pos, d in _build_def_map().items()}
+    created = updated = sin_cambios = skipped = 0
+    errores: list[tuple[int | None, str]] = []   # (fila, mensaje); fila None = lote
+
+    # ----------------------------------------------------------------------
+    # 2.a) Parseo y validación por fila (sin escrituras en BD)
+    # ----------------------------------------------------------------------
+    preparadas = []   # (fila, (ejercicio, sec_eve), campos, {pos: (monto_base, valor)})
+
+    # Clasifica las columnas F*_MONTO / F*_FACTOR una sola vez por archivo
+    # (todas las filas comparten encabezados), no en cada fila.
+    columnas = set().union(*rows)
+    monto_cols = {k: pos for k in columnas if (pos := is_monto_col(k))}
+    factor_cols = {k: pos for k in columnas if (pos := is_factor_col(k))}
+    # Catálogos leídos una vez por archivo (caché compartida, ver settings)
+    mercados = _mercados_catalogo()
+    tipos_ingreso = _tipos_ingreso_catalogo()
+    # Tipo de ingreso por defecto (filas sin tipo_ingreso_id válido)
+    tipo_default = default_tipo_ingreso()
+    # Textos por defecto según el tipo de archivo (constante en todo el archivo)
+    es_pdf = meta.get("tipo") == "pdf"
+    nemo_default = "PDF" if es_pdf else ""
+    descripcion_default = "PDF Cert70" if es_pdf else ""
+    for i, r in enumerate(rows, start=1):
+        try:
+            # ----------------- Encabezado/calificación base -----------------
+            ejercicio   = to_int(r.get("ejercicio"))
+            sec_eve     = to_int(r.get("sec_eve"))
+            fec_pago    = _FECHA_PAGO.to_python(r.get("fecha_pago") or None)
+            nemo        = r.get("nemo") or r.get("instrumento") or nemo_default
+            # La descripción viene extendida por annotate_preview (detalle de
+            # montos/factores): se recorta al largo de la columna
+            descripcion = (r.get("descripcion") or descripcion_default)[:_MAX_DESCRIPCION]
+            mercado     = find_mercado(r.get("mercado_cod") or r.get("mercado"), mercados)
+            tipo_ingreso = tipo_ingreso_by_id(r.get("tipo_ingreso_id"), tipos_ingreso) or tipo_default
+
+            # Requisito mínimo: mercado válido. annotate_preview ya bloquea el
+            # archivo si falta; se re-verifica por si el catálogo cambió entre
+            # la vista previa y la confirmación (búsqueda en catálogo cacheado).
+            if not mercado:
+                skipped += 1
+                errores.append((i, f"mercado no encontrado ({r.get('mercado_cod')})."))
+                continue
 
-    # Transacción: todo o nada por consistencia
-    with transaction.atomic():
-        for i, r in enumerate(rows, start=1):
-            try:
-                # ----------------- Encabezado/calificación base -----------------
-                ejercicio   = to_int(r.get("ejercicio"))
-                sec_eve     = to_int(r.get("sec_eve"))
-                fec_pago    = r.get("fecha_pago") or None
-                nemo        = r.get("nemo") or r.get("instrumento") or ((meta.get("tipo") == "pdf") and "PDF") or ""
-                descripcion = r.get("descripcion") or ((meta.get("tipo") == "pdf") and "PDF Cert70") or ""
-                mercado     = find_mercado(r.get("mercado_cod") or r.get("mercado"))
-                tipo_ingreso = tipo_ingreso_by_id(r.get("tipo_ingreso_id")) \
-                               or TblTipoIngreso.objects.order_by("pk").first()
-
-                # Requisito mínimo: mercado válido
-                if not mercado:
+            # ----------------- Factores de la fila -----------------
+            # Modo 'montos' -> calcula factores proporcionalmente a total (8..19)
+            if modo == "montos":
+                montos: dict[int, D] = {}
+
+                # Recolecta montos por posición (columnas ya clasificadas)
+                for k, pos in monto_cols.items():
+                    if k in r:
+                        montos[pos] = to_dec(r[k])
+
+                # Aritmética entera: montos en centavos (escala de monto_base)
+                enteros = _montos_a_enteros(montos)
+                total_int = sum(v for pos, v in enteros.items() if pos in POSICIONES_BASE)
+
+                # Necesitamos total > 0 para poder calcular
+                if total_int <= 0:
                     skipped += 1
-                    errores.append(f"Fila {i}: mercado no encontrado ({r.get('mercado_cod')}).")
+                    errores.append((i, "total 8..19 = 0; no se pueden calcular factores."))
                     continue
 
-                # Crea/actualiza la calificación principal (clave: ejercicio + secuencia_evento)
-                calif, was_created = TblCalificacion.objects.get_or_create(
-                    ejercicio=ejercicio,
-                    secuencia_evento=sec_eve,
-                    defaults={
-                        "mercado": mercado,
-                        "instrumento_text": nemo,
-                        "tipo_ingreso": tipo_ingreso,
-                        "descripcion": descripcion,
-                        "fecha_pago_dividendo": fec_pago,
-                        "dividendo": to_dec(r.get("dividendo")),  # Col 1: número del dividendo
-                        "factor_actualizacion": to_dec(r.get("factor_actualizacion"), D("1")),  # Col 5
-                        "usuario": request.user,
-                        "archivo_fuente": archivo_fuente,
-                    }
-                )
+                # Factores escalados a 1e8 (restos mayores en 8..19: la suma
+                # base nunca pasa de 1); solo las posiciones con monto se
+                # calculan, el resto es 0.
+                factores = {pos: (ZERO, ZERO) for pos in POSICIONES}
+                for pos, f_int in _factores8_int(enteros, total_int).items():
+                    factores[pos] = (montos[pos], D(f_int).scaleb(-8))
+
+            # Modo 'factors' -> valida suma 8..19 <= 1 y guarda tal cual
+            else:
+                suma_8_19 = ZERO
+                valores: dict[int, D] = {}
+
+                # Recolecta factores por posición (columnas ya clasificadas)
+                for k, p in factor_cols.items():
+                    if k in r:
+                        fval = to_dec(r[k])
+                        valores[p] = fval
+                        if POS_MIN <= p <= POS_BASE_MAX:
+                            suma_8_19 += fval
+
+                # Suma de base no puede superar 1.0
+                if suma_8_19 > UNO:
+                    skipped += 1
+                    errores.append((i, f"suma 8..19 = {suma_8_19} > 1.0"))
+                    continue
 
-                # Si ya existía: refresca campos básicos
-                if not was_created:
-                    calif.mercado = mercado
-                    calif.instrumento_text = nemo
-                    calif.tipo_ingreso = tipo_ingreso
-                    calif.descripcion = descripcion
-                    if fec_pago:
-                        calif.fecha_pago_dividendo = fec_pago
-                    calif.usuario = request.user
-                    calif.archivo_fuente = archivo_fuente
-                    calif.save(update_fields=[
-                        "mercado", "instrumento_text", "tipo_ingreso", "descripcion",
-                        "fecha_pago_dividendo", "usuario", "archivo_fuente"
-                    ])
-
-                # ----------------- Persistencia de factores -----------------                
-                # Modo 'montos' -> calcula factores proporcionalmente a total (8..19)
-                if modo == "montos":
-                    total_base = D("0")
-                    montos: dict[int, D] = {}
-
-                    # Recolecta montos por posición
-                    for k, v in r.items():
-                        pos = is_monto_col(k)
-                        if pos:
-                            m = to_dec(v)
-                            montos[pos] = m
-                            if POS_MIN <= pos <= POS_BASE_MAX:
-                                total_base += m
-
-                    # Necesitamos total > 0 para poder calcular
-                    if total_base <= 0:
-                        skipped += 1
-                        errores.append(f"Fila {i}: total 8..19 = 0; no se pueden calcular factores.")
-                        continue
-
-                    # Calcula y guarda
-                    for pos in range(POS_MIN, POS_MAX + 1):
-                        m = montos.get(pos, D("0"))
-                        factor = _round8(m / total_base) if total_base > 0 else D("0")
-                        TblFactorValor.objects.update_or_create(
-                            calificacion=calif,
-                            posicion=pos,
-                            defaults={
-                                "monto_base": m,
-                                "valor": factor,
-                                "factor_def": def_map.get(pos),
-                            },
-                        )
-
-                # Modo 'factors' -> valida suma 8..19 <= 1 y guarda tal cual
-                else:
-                    suma_8_19 = D("0")
-                    factores: dict[int, D] = {}
-
-                    # Recolecta factores por posición
-                    for k, v in r.items():
-                        p = is_factor_col(k)
-                        if p:
-                            fval = to_dec(v)
-                            factores[p] = fval
-                            if POS_MIN <= p <= POS_BASE_MAX:
-                                suma_8_19 += fval
-
-                    # Suma de base no puede superar 1.0
-                    if suma_8_19 > D("1"):
-                        skipped += 1
-                        errores.append(f"Fila {i}: suma 8..19 = {suma_8_19} > 1.0")
-                        continue
-
-                    # Guarda factores tal cual
-                    for pos in range(POS_MIN, POS_MAX + 1):
-                        fval = factores.get(pos, D("0"))
-                        TblFactorValor.objects.update_or_create(
-                            calificacion=calif,
-                            posicion=pos,
-                            defaults={
-                                "monto_base": None,
-                                "valor": fval,
-                                "factor_def": def_map.get(pos),
-                            },
-                        )
-
-                # Contabiliza resultado (creado vs actualizado)
-                if was_created:
-                    created += 1
-                else:
-                    updated += 1
-
-            except Exception as ex:
-                # Cualquier problema en la fila -> se omite y se reporta
+                factores = {
+                    pos: (None, valores.get(pos, ZERO))
+                    for pos in POSICIONES
+                }
+
+            campos = {
+                "mercado": mercado,
+                "instrumento_text": nemo,
+                "tipo_ingreso": tipo_ingreso,
+                "descripcion": descripcion,
+                "fecha_pago_dividendo": fec_pago,
+                "dividendo": to_dec(r.get("dividendo")),  # Col 1: número del dividendo
+                "factor_actualizacion": to_dec(r.get("factor_actualizacion"), UNO),  # Col 5
+            }
+
+            # Valores que no caben en su columna: error de la fila, no del lote
+            error = _error_de_rango((ejercicio, sec_eve), campos, factores)
+            if error:
                 skipped += 1
-                errores.append(f"Fila {i}: {ex}")
+                errores.append((i, error))
+                continue
+
+            campos["row_hash"] = _row_hash(
+                (ejercicio, sec_eve), campos, factores, request.user, archivo_fuente
+            )
+            preparadas.append((i, (ejercicio, sec_eve), campos, factores))
+
+        except Exception as ex:
+            # Cualquier problema en la fila -> se omite y se reporta
+            skipped += 1
+            errores.append((i, str(ex)))
+
+    # ----------------------------------------------------------------------
+    # 2.b) Escritura masiva en lotes de BULK_BATCH_SIZE calificaciones, cada
+    #      uno en su transacción: bloqueos cortos y, si la BD rechaza un lote
+    #      (suma 8..19 > 1, valor fuera de rango, ...), los demás se graban
+    #      y el lote queda en el reporte de errores.
+    # ----------------------------------------------------------------------
+    # Agrupa por clave (orden del archivo): las filas repetidas de una
+    # calificación caen siempre en el mismo lote.
+    por_clave: dict[tuple[int, int], list] = {}
+    for item in preparadas:
+        por_clave.setdefault(item[1], []).append(item)
+    claves = list(por_clave)
+
+    for n_lote, inicio in enumerate(range(0, len(claves), BULK_BATCH_SIZE), start=1):
+        lote = [
+            item
+            for clave in claves[inicio:inicio + BULK_BATCH_SIZE]
+            for item in por_clave[clave]
+        ]
+        try:
+            c, u, n, s, errs = _importar_lote(lote, request.user, archivo_fuente, def_ids)
+        except DatabaseError as ex:
+            # IntegrityError, DataError, ...: solo este lote se revierte
+            logger.warning("Carga %s: lote %s rechazado por la BD: %s",
+                           archivo_fuente.archivo_fuente_id, n_lote, ex)
+            skipped += len(lote)
+            errores.append((
+                None,
+                f"Lote {n_lote} ({len(lote)} filas): la base de datos rechazó el lote ({ex}).",
+            ))
+            continue
+        created += c
+        updated += u
+        sin_cambios += n
+        skipped += s
+        errores.extend(errs)
 
     # Limpia sesión de preview para evitar re-importes accidentales
     _clear_upload_session(request)
 
+    # Reporte de errores en BD (reemplaza el de la carga anterior del mismo
+    # archivo); la UI muestra solo el conteo y el enlace al reporte paginado.
+    with transaction.atomic():
+        TblImportError.objects.filter(archivo_fuente=archivo_fuente).delete()
+        TblImportError.objects.bulk_create(
+            (
+                TblImportError(archivo_fuente=archivo_fuente, fila=fila, mensaje=mensaje)
+                for fila, mensaje in errores
+            ),
+            batch_size=BULK_BATCH_SIZE,
+        )
+
     # Mensajes finales
     if errores:
-        # Muestra solo los primeros N errores para no saturar
-        messages.warning(request, "Algunas filas se omitieron:\n" + "\n".join(errores[:10]))
+        messages.warning(request, format_html(
+            'Algunas filas se omitieron ({} errores). <a href="{}">Ver reporte</a>',
+            len(errores),
+            reverse("carga_errores", args=[archivo_fuente.archivo_fuente_id]),
+        ))
     messages.success(
         request,
-        f"Grabado OK. Creados: {created}, Actualizados: {updated}, Omitidos: {skipped}."
+        f"Grabado OK. Creados: {created}, Actualizados: {updated}, "
+        f"Sin cambios: {sin_cambios}, Omitidos: {skipped}."
+    )
+    return redirect("main")
+
+
+# ============================================================================
+# VISTA: REPORTE DE ERRORES DE CARGA
+# ============================================================================
+@login_required(login_url="login")
+@permission_required("core.add_tblcalificacion", raise_exception=True)
+def carga_errores(request, archivo_fuente_id: int):
+    """Errores de la última carga de un archivo, paginados en BD (50 por página)."""
+    archivo_fuente = get_object_or_404(
+        TblArchivoFuente.objects.only("archivo_fuente_id", "nombre_archivo"),
+        pk=archivo_fuente_id,
+    )
+    paginator = Paginator(
+        TblImportError.objects.filter(archivo_fuente=archivo_fuente).only("fila", "mensaje"),
+        50,
     )
-    return redirect("main")
\ No newline at end of file
+    page_obj = paginator.get_page(request.GET.get("page"))
+    return render(request, "calificaciones/carga_errores.html", {
+        "archivo_fuente": archivo_fuente,
+        "page_obj": page_obj,
+    })
@@ -1,12 +1,13 @@
-# core/views.py
+# core/views/mainv.py
 """
 Vistas principales del Mantenedor de Calificaciones:
-- Dashboard / Auditoría (placeholder)
-- Autenticación (welcome / login / logout)
+- Dashboard de administración (métricas simples)
+- Autenticación (welcome / login / logout) y verificación de sesión activa
 - Listado con filtros (main_view)
 - Creación manual (paso 1) y edición (paso 2)
 - Eliminación múltiple
 - Detalle de calificación
+- Helpers montos -> factores (aritmética entera) compartidos con la carga masiva
 """
 
 # =============================================================================
@@ -19,6 +20,12 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User, Group
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
+from django.utils.connection import ConnectionProxy
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.cache import never_cache
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Prefetch
 
 from core.models import (
     TblCalificacion, TblFactorValor, TblFactorDef,
@@ -34,6 +41,31 @@ POS_MIN = 8
 POS_BASE_MAX = 19   # rango base para sumatoria (8..19)
 POS_MAX = 37
 FACTOR_MAX_SUM = Decimal("1.00000000")  # tope de suma en 8..19
+FACTOR_SCALE = 10 ** 8                   # factores con 8 decimales
+ZERO = Decimal("0")
+UNO = Decimal("1")
+CUANTO_8 = Decimal("0.00000001")         # cuanto de _round8
+# Nombre con que el trigger de BD (migración 0008) reporta suma 8..19 > 1
+SUMA_BASE_CONSTRAINT = "chk_suma_factores_base"
+
+# Posiciones de factores (todas / base 8..19), compartidas por las vistas
+POSICIONES = range(POS_MIN, POS_MAX + 1)
+POSICIONES_BASE = range(POS_MIN, POS_BASE_MAX + 1)
+
+# Columna de montos: escala (centavos) y rango para la conversión a enteros
+_MONTO_BASE = TblFactorValor._meta.get_field("monto_base")
+
+# Nombres de campo por posición (evita armar f-strings en cada request)
+MONTO_KEYS = {pos: f"monto_{pos}" for pos in POSICIONES}
+FACTOR_KEYS = {pos: f"factor_{pos}" for pos in POSICIONES}
+
+# Caché de catálogos compartida entre workers (ver settings.CACHES): las
+# señales de core/signals.py la invalidan para todos los procesos
+catalogos_cache = ConnectionProxy(caches, "catalogos")
+
+# Caché del catálogo TblFactorDef (invalidada por señales, ver core/signals.py)
+FACTOR_DEFS_CACHE_KEY = "factor_defs_8_37"
+FACTOR_DEFS_CACHE_TTL = 60 * 60  # 1 hora
 
 
 # =============================================================================
@@ -41,7 +73,15 @@ FACTOR_MAX_SUM = Decimal("1.00000000")  # tope de suma en 8..19
 # =============================================================================
 def _round8(x: Decimal) -> Decimal:
     """Redondea a 8 decimales con HALF_UP (ej.: 0.123456789 -> 0.12345679)."""
-    return x.quantize(Decimal("0.00000001"), rounding=ROUND_HALF_UP)
+    return x.quantize(CUANTO_8, rounding=ROUND_HALF_UP)
+
+def _excede_suma_base(ex: IntegrityError) -> bool:
+    """¿El IntegrityError viene del trigger de suma 8..19 (y no de otra restricción)?"""
+    causa = ex.__cause__
+    return (
+        getattr(causa, "sqlstate", None) == "23514"   # check_violation
+        and getattr(getattr(causa, "diag", None), "constraint_name", None) == SUMA_BASE_CONSTRAINT
+    )
 
 def _in_group(user, group_name: str) -> bool:
     """¿El usuario pertenece al grupo indicado?"""
@@ -58,50 +98,141 @@ def _redirect_after_login(user):
 # HELPERS DE NEGOCIO (catálogo factores + armado de initial)
 # =============================================================================
 def _build_def_map():
-    """Devuelve {pos: TblFactorDef} solo para posiciones activas 8..37."""
-    defs_qs = (
-        TblFactorDef.objects
-        .filter(posicion__gte=POS_MIN, posicion__lte=POS_MAX, activo=True)
-        .order_by("posicion")
-    )
-    return {d.posicion: d for d in defs_qs}
+    """
+    Devuelve {pos: TblFactorDef} solo para posiciones activas 8..37.
+    El catálogo es prácticamente estático: se cachea y se invalida desde
+    core/signals.py al guardar/eliminar un TblFactorDef.
+    """
+    def _load():
+        defs_qs = (
+            TblFactorDef.objects
+            .filter(posicion__gte=POS_MIN, posicion__lte=POS_MAX, activo=True)
+            # Solo lo que se usa: pk (FK de factores), etiqueta y ayuda de forms
+            .only("posicion", "nombre", "descripcion")
+            .order_by("posicion")
+        )
+        return {d.posicion: d for d in defs_qs}
+
+    return catalogos_cache.get_or_set(FACTOR_DEFS_CACHE_KEY, _load, FACTOR_DEFS_CACHE_TTL)
 
 def _initial_data(calif: TblCalificacion):
-    """Construye initial data (montos/factores) para precargar formularios."""
-    qs = calif.factores.filter(posicion__gte=POS_MIN, posicion__lte=POS_MAX)
-    initial_montos = {f"monto_{fv.posicion}": fv.monto_base for fv in qs}
-    initial_factores = {f"factor_{fv.posicion}": fv.valor for fv in qs}
+    """
+    Construye initial data (montos/factores) para precargar formularios.
+    Una sola consulta: ambos dicts salen de la misma lista materializada.
+    """
+    existentes = list(
+        calif.factores
+        .filter(posicion__gte=POS_MIN, posicion__lte=POS_MAX)
+        .values_list("posicion", "monto_base", "valor")
+    )
+    initial_montos = {MONTO_KEYS[pos]: monto for pos, monto, _ in existentes}
+    initial_factores = {FACTOR_KEYS[pos]: valor for pos, _, valor in existentes}
     return initial_montos, initial_factores
 
+def _factor8_int(num: int, den: int) -> int:
+    """
+    num/den escalado a 1e8 con HALF_UP, usando solo enteros (exacto).
+    Ej.: _factor8_int(1, 3) -> 33333333  (== 0.33333333 * 1e8)
+    """
+    q, r = divmod(abs(num) * FACTOR_SCALE, den)
+    if 2 * r >= den:
+        q += 1
+    return q if num >= 0 else -q
+
+def _decimal_fuera_de_rango(valor, field) -> bool:
+    """¿valor no cabe en la columna numeric(max_digits, decimal_places)?"""
+    if valor is None:
+        return False
+    if not valor.is_finite():
+        return True
+    limite = Decimal(10) ** (field.max_digits - field.decimal_places)
+    if abs(valor) >= limite:
+        return True
+    # Postgres redondea al guardar (mitad lejos de cero): 9999.999999999 en
+    # numeric(12,8) queda en 10000 y desborda
+    cuanto = Decimal(1).scaleb(-field.decimal_places)
+    return abs(valor.quantize(cuanto, rounding=ROUND_HALF_UP)) >= limite
+
+def _montos_a_enteros(montos: dict[int, Decimal]) -> dict[int, int]:
+    """
+    Montos de una fila en centavos enteros: la escala de monto_base
+    (2 decimales, HALF_UP). Enteros acotados aunque la celda traiga un
+    exponente extremo (p.ej. 1E-999999).
+    Ej.: {8: D("10.5"), 9: D("2")} -> {8: 1050, 9: 200}
+    Un monto que no cabe en la columna lanza ValueError (error de la fila).
+    """
+    cuanto = Decimal(1).scaleb(-_MONTO_BASE.decimal_places)
+    enteros = {}
+    for pos, m in montos.items():
+        if _decimal_fuera_de_rango(m, _MONTO_BASE):
+            raise ValueError(f"monto F{pos} fuera de rango ({m}).")
+        enteros[pos] = int(m.quantize(cuanto, rounding=ROUND_HALF_UP).scaleb(_MONTO_BASE.decimal_places))
+    return enteros
+
+def _factores8_int(enteros: dict[int, int], total: int) -> dict[int, int]:
+    """
+    Factores enteros escalados a 1e8 (enteros[pos] / total) por posición.
+    8..19 por restos mayores: piso de cada cuota y las unidades que faltan a
+    los restos más grandes, así la suma base es exactamente 1 cuando total
+    es la suma de 8..19. Con HALF_UP por posición se podía pasar
+    (6 montos iguales -> 6 x 0.16666667 = 1.00000002). Resto: HALF_UP.
+    Ej.: _factores8_int({8: 1, 9: 1, 10: 1}, 3) -> {8: 33333334, 9: 33333333, 10: 33333333}
+    """
+    factores = {}
+    restos = []   # (resto, pos) de la base
+    for pos, n in enteros.items():
+        if pos in POSICIONES_BASE:
+            factores[pos], resto = divmod(n * FACTOR_SCALE, total)
+            restos.append((resto, pos))
+        else:
+            factores[pos] = _factor8_int(n, total)
+    # Unidades hasta el piso del reparto exacto de la base
+    base = sum(enteros[pos] for _, pos in restos)
+    faltan = base * FACTOR_SCALE // total - sum(factores[pos] for _, pos in restos)
+    # Mayor resto primero; empate: menor posición
+    for _, pos in sorted(restos, key=lambda rp: (-rp[0], rp[1]))[:faltan]:
+        factores[pos] += 1
+    return factores
+
 def _calc_factores_desde_montos(montos_form, def_map):
     """
     Calcula factores proporcionales: factor_pos = monto_pos / suma(8..19)
+    Aritmética entera: montos en centavos y factores escalados a 1e8;
+    solo se vuelve a Decimal al armar el resultado.
     Retorna: (factores_dict, total_base_8_19, suma_factores_8_19)
     """
-    total = montos_form.total_8_19()
+    data = montos_form.cleaned_data
+    montos = {pos: data.get(key) or ZERO for pos, key in MONTO_KEYS.items()}
+    # Los montos vienen validados con 2 decimales -> centavos exactos
+    cents = {pos: int(m * 100) for pos, m in montos.items()}
+    total_cents = sum(cents[pos] for pos in POSICIONES_BASE)
+
+    # Restos mayores en 8..19: la suma base calculada nunca pasa de 1
+    f_ints = _factores8_int(cents, total_cents) if total_cents > 0 else {}
     factores = {}
-    suma_8_19 = Decimal("0")
-
-    for pos in range(POS_MIN, POS_MAX + 1):
-        monto = montos_form.cleaned_data.get(f"monto_{pos}") or Decimal("0")
-        factor = _round8(monto / total) if total > 0 else Decimal("0")
+    suma_int = 0
+    for pos in POSICIONES:
+        f_int = f_ints.get(pos, 0)
+        factor = Decimal(f_int).scaleb(-8) if total_cents > 0 else ZERO
         nombre = def_map[pos].nombre if pos in def_map else str(pos)
-        factores[pos] = {"monto": monto, "factor": factor, "nombre": nombre}
-        if POS_MIN <= pos <= POS_BASE_MAX:
-            suma_8_19 += factor
+        factores[pos] = {"monto": montos[pos], "factor": factor, "nombre": nombre}
+        if pos <= POS_BASE_MAX:
+            suma_int += f_int
 
-    return factores, total, suma_8_19
+    total = Decimal(total_cents).scaleb(-2)
+    return factores, total, Decimal(suma_int).scaleb(-8)
 
 def _collect_factores_desde_form(factores_form, def_map):
     """
     Lee factores manuales del form y calcula suma_8_19.
     Retorna: (factores_dict, suma_factores_8_19)
     """
+    data = factores_form.cleaned_data
     factores = {}
-    suma_8_19 = Decimal("0")
+    suma_8_19 = ZERO
 
-    for pos in range(POS_MIN, POS_MAX + 1):
-        factor = factores_form.cleaned_data.get(f"factor_{pos}") or Decimal("0")
+    for pos, key in FACTOR_KEYS.items():
+        factor = data.get(key) or ZERO
         nombre = def_map[pos].nombre if pos in def_map else str(pos)
         factores[pos] = {"factor": factor, "nombre": nombre}
         if POS_MIN <= pos <= POS_BASE_MAX:
@@ -109,9 +240,42 @@ def _collect_factores_desde_form(factores_form, def_map):
 
     return factores, suma_8_19
 
+def _guardar_factores(calif: TblCalificacion, factores: dict, def_map, usuario) -> None:
+    """
+    Persiste los factores 8..37 de la calificación con un solo upsert
+    (INSERT ... ON CONFLICT (calificacion_id, posicion) DO UPDATE) y marca
+    la edición manual en la cabecera, todo en una transacción.
+    La BD valida suma 8..19 <= 1 al terminar el upsert (trigger por
+    sentencia): IntegrityError, ver _excede_suma_base.
+    """
+    def_ids = {pos: d.pk for pos, d in def_map.items()}
+    objs = [
+        TblFactorValor(
+            calificacion_id=calif.pk,
+            posicion=pos,
+            monto_base=row.get("monto"),   # modo factores: sin monto base
+            valor=row["factor"],
+            factor_def_id=def_ids.get(pos),   # enlaza al catálogo si existe
+        )
+        for pos, row in factores.items()
+    ]
+    with transaction.atomic():
+        # Bloquea la cabecera: ediciones concurrentes (o una carga masiva,
+        # que bloquea igual) de la misma calificación se serializan
+        list(TblCalificacion.objects.select_for_update().filter(pk=calif.pk).values_list("pk"))
+        TblFactorValor.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=["calificacion", "posicion"],
+            update_fields=["monto_base", "valor", "factor_def"],
+        )
+        calif.usuario = usuario
+        calif.row_hash = ""  # edición manual: invalida la huella de carga
+        calif.save(update_fields=["usuario", "row_hash"])
+
 
 # =============================================================================
-# DASHBOARD / AUDITORÍA 
+# DASHBOARD
 # =============================================================================
 @login_required(login_url="login")
 def dashboard(request):
@@ -144,24 +308,6 @@ def dashboard(request):
         return render(request, "dashboards/admin.html", context)
     return redirect("main")
 
-@login_required(login_url="login")
-def auditoria_list(request):
-    """
-    Placeholder de Auditoría: restringido a admin/superuser.
-    (Cambia por ListView real cuando exista el modelo.)
-    """
-    user = request.user
-    if not (user.is_superuser or user.groups.filter(name="Administrador").exists()):
-        messages.error(request, "No tienes permisos para ver Auditoría.")
-        return redirect("main")
-
-    auditorias = []  
-
-    return render(request, "auditoria/lista_log.html", {
-        "auditorias": auditorias,
-        "es_admin": True,
-    })
-
 
 # =============================================================================
 # AUTENTICACIÓN (welcome / login / logout)
@@ -191,17 +337,19 @@ def logout_view(request):
 # VERIFICACION SESIÓN ACTIVA 
 # =============================================================================
 
+@never_cache
 def check_session(request):
-    request.session.modified = False  # No modifica la sesión
-
+    """
+    Consulta del timer JS (solo cuando expira localmente): no debe quedar en
+    caché de navegador/proxy. Con SESSION_SAVE_EVERY_REQUEST la sesión se
+    guarda igual, así que no se toca session.modified.
+    """
     if not request.user.is_authenticated:
         return JsonResponse({
             'authenticated': False,
             'message': 'Sesión expirada'
         }, status=401)
-    
-    request.session.modified = False
-    
+
     return JsonResponse({
         'authenticated': True,
         'username': request.user.username,
@@ -214,16 +362,22 @@ def check_session(request):
 def main_view(request):
     """
     Lista calificaciones con filtros por mercado, tipo_ingreso y ejercicio.
-    Prepara factores en dos formatos para el template (map y array).
+    Prepara factores como array por posición (8..37) para el template.
     """
     filtro_mercado = request.GET.get("mercado", "")
     filtro_tipo_ingreso = request.GET.get("tipo_ingreso", "")
     filtro_ejercicio = request.GET.get("ejercicio", "")
 
-    qs = (
-        TblCalificacion.objects
-        .select_related("mercado", "tipo_ingreso")
-        .prefetch_related("factores")
+    # El listado no muestra mercado/tipo_ingreso: sin JOINs extra.
+    # Factores en una sola consulta adicional, solo con las columnas usadas.
+    qs = TblCalificacion.objects.prefetch_related(
+        Prefetch(
+            "factores",
+            queryset=TblFactorValor.objects.filter(
+                posicion__gte=POS_MIN, posicion__lte=POS_MAX
+            ).only("calificacion_id", "posicion", "valor"),
+            to_attr="factores_list",
+        )
     )
 
     # Filtros opcionales
@@ -239,17 +393,12 @@ def main_view(request):
 
     items = qs.order_by("-fecha_creacion")[:500]
 
-    # Arma estructuras de factores para mostrar en tabla 
+    # Arma el array de factores (índice = posicion - POS_MIN) para la tabla
     for it in items:
-        try:
-            factor_qs = it.factores.all()
-        except Exception:
-            # Compatibilidad si el related_name fuera diferente
-            factor_qs = it.tblfactorvalor_set.all()
-
-        factores_map = {int(f.posicion): f.valor for f in factor_qs}
-        it.factores_map = factores_map
-        it.factores_array = [factores_map.get(pos) for pos in range(POS_MIN, POS_MAX + 1)]
+        arr = [None] * (POS_MAX - POS_MIN + 1)
+        for f in it.factores_list:
+            arr[f.posicion - POS_MIN] = f.valor
+        it.factores_array = arr
 
     context = {
         "items": items,
@@ -310,9 +459,18 @@ def calificacion_edit(request, pk: int):
     """
     calif = get_object_or_404(TblCalificacion, pk=pk)
     def_map = _build_def_map()
-    initial_montos, initial_factores = _initial_data(calif)
+    # Initial de BD: solo se consulta si se renderiza el formulario del "otro"
+    # modo (los POST que guardan y redirigen no lo necesitan).
+    initial = SimpleLazyObject(lambda: _initial_data(calif))
     modo_ingreso = request.POST.get("modo_ingreso", request.GET.get("modo_ingreso", "montos"))
 
+    def _render(montos_form, factores_form, **extra):
+        """Renderiza el formulario con el contexto común más lo propio de cada rama."""
+        return render(request, "calificaciones/form_factores.html", {
+            "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
+            "def_map": def_map, "modo_ingreso": modo_ingreso, **extra,
+        })
+
     # --------------------------- POST (acciones) ---------------------------
     if request.method == "POST":
         action = request.POST.get("action")
@@ -332,7 +490,9 @@ def calificacion_edit(request, pk: int):
         # --------- MODO: MONTOS (calcula factores) ---------
         if modo_ingreso == "montos":
             montos_form = MontosForm(request.POST, factor_defs=def_map)
-            factores_form = FactoresForm(initial=initial_factores, factor_defs=def_map)
+            factores_form = SimpleLazyObject(
+                lambda: FactoresForm(initial=initial[1], factor_defs=def_map)
+            )
 
             if montos_form.is_valid():
                 factores, total, suma_8_19 = _calc_factores_desde_montos(montos_form, def_map)
@@ -340,55 +500,50 @@ def calificacion_edit(request, pk: int):
                 # Validaciones básicas
                 if total <= 0:
                     messages.error(request, "❌ Debes ingresar al menos un monto mayor a 0 en 8-19.")
-                    return render(request, "calificaciones/form_factores.html", {
-                        "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
-                        "def_map": def_map, "modo_ingreso": modo_ingreso,
-                    })
+                    return _render(montos_form, factores_form)
 
                 if suma_8_19 > FACTOR_MAX_SUM:
                     messages.error(request, f"❌ La suma de factores 8-19 = {suma_8_19} supera {FACTOR_MAX_SUM}.")
-                    return render(request, "calificaciones/form_factores.html", {
-                        "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
-                        "factores": factores, "total": total,
-                        "suma_factores_8_19": suma_8_19, "suma_valida": False,
-                        "def_map": def_map, "modo_ingreso": modo_ingreso,
-                    })
+                    return _render(
+                        montos_form, factores_form,
+                        factores=factores, total=total, suma_factores_8_19=suma_8_19,
+                        suma_valida=False,
+                    )
 
                 # Acción: solo calcular (mostrar vista previa)
                 if action == "calcular":
                     messages.info(request, "✅ Cálculo realizado. Revisa y pulsa Guardar para persistir.")
-                    return render(request, "calificaciones/form_factores.html", {
-                        "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
-                        "factores": factores, "total": total,
-                        "suma_factores_8_19": suma_8_19, "suma_valida": True,
-                        "def_map": def_map, "modo_ingreso": modo_ingreso,
-                    })
+                    return _render(
+                        montos_form, factores_form,
+                        factores=factores, total=total, suma_factores_8_19=suma_8_19,
+                        suma_valida=True,
+                    )
 
                 # Acción: guardar (persistir factores calculados)
                 if action == "guardar":
-                    for pos, row in factores.items():
-                        TblFactorValor.objects.update_or_create(
-                            calificacion=calif, posicion=pos,
-                            defaults={
-                                "monto_base": row["monto"],
-                                "valor": row["factor"],
-                                "factor_def": def_map.get(pos),
-                            },
+                    # Un upsert + cabecera en una transacción (el GET no abre ninguna)
+                    try:
+                        _guardar_factores(calif, factores, def_map, request.user)
+                    except IntegrityError as ex:
+                        if not _excede_suma_base(ex):
+                            raise
+                        messages.error(request, f"❌ La suma de factores 8-19 supera {FACTOR_MAX_SUM}. No se guardaron cambios.")
+                        return _render(
+                            montos_form, factores_form,
+                            factores=factores, total=total, suma_factores_8_19=suma_8_19,
+                            suma_valida=False,
                         )
-                    calif.usuario = request.user
-                    calif.save(update_fields=["usuario"])
                     messages.success(request, "✅ Calificación guardada correctamente.")
                     return redirect("main")
 
             # Si el form no es válido o hubo errores, vuelve al formulario
-            return render(request, "calificaciones/form_factores.html", {
-                "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
-                "def_map": def_map, "modo_ingreso": modo_ingreso,
-            })
+            return _render(montos_form, factores_form)
 
         # --------- MODO: FACTORES (manual) ---------
         else:
-            montos_form = MontosForm(initial=initial_montos, factor_defs=def_map)
+            montos_form = SimpleLazyObject(
+                lambda: MontosForm(initial=initial[0], factor_defs=def_map)
+            )
             factores_form = FactoresForm(request.POST, factor_defs=def_map)
 
             if factores_form.is_valid():
@@ -401,56 +556,48 @@ def calificacion_edit(request, pk: int):
                         messages.success(request, f"✅ Validación exitosa. Suma = {suma_8_19}. Pulsa Guardar para persistir.")
                     else:
                         messages.error(request, f"❌ La suma de factores 8-19 = {suma_8_19} supera {FACTOR_MAX_SUM}.")
-                    return render(request, "calificaciones/form_factores.html", {
-                        "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
-                        "factores": factores, "suma_factores_8_19": suma_8_19,
-                        "suma_valida": suma_valida, "def_map": def_map, "modo_ingreso": modo_ingreso,
-                    })
+                    return _render(
+                        montos_form, factores_form,
+                        factores=factores, suma_factores_8_19=suma_8_19,
+                        suma_valida=suma_valida,
+                    )
 
                 # Acción: guardar (persiste si pasa validación)
                 if action == "guardar":
                     if not suma_valida:
                         messages.error(request, "❌ No se puede guardar. La suma de factores 8-19 excede 1.0")
-                        return render(request, "calificaciones/form_factores.html", {
-                            "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
-                            "factores": factores, "suma_factores_8_19": suma_8_19,
-                            "suma_valida": suma_valida, "def_map": def_map, "modo_ingreso": modo_ingreso,
-                        })
-
-                    for pos, row in factores.items():
-                        TblFactorValor.objects.update_or_create(
-                            calificacion=calif, posicion=pos,
-                            defaults={
-                                "monto_base": None,
-                                "valor": row["factor"],
-                                "factor_def": def_map.get(pos),  # enlaza al catálogo si existe
-                            },
+                        return _render(
+                            montos_form, factores_form,
+                            factores=factores, suma_factores_8_19=suma_8_19,
+                            suma_valida=suma_valida,
+                        )
+
+                    try:
+                        _guardar_factores(calif, factores, def_map, request.user)
+                    except IntegrityError as ex:
+                        if not _excede_suma_base(ex):
+                            raise
+                        messages.error(request, "❌ No se puede guardar. La suma de factores 8-19 excede 1.0")
+                        return _render(
+                            montos_form, factores_form,
+                            factores=factores, suma_factores_8_19=suma_8_19, suma_valida=False,
                         )
-                    calif.usuario = request.user
-                    calif.save(update_fields=["usuario"])
                     messages.success(request, "✅ Factores guardados manualmente.")
                     return redirect("main")
 
             # Si el form falla, recarga con mensajes
-            return render(request, "calificaciones/form_factores.html", {
-                "calif": calif, "montos_form": montos_form, "factores_form": factores_form,
-                "def_map": def_map, "modo_ingreso": modo_ingreso,
-            })
+            return _render(montos_form, factores_form)
 
     # --------------------------- GET (carga inicial) ---------------------------
+    initial_montos, initial_factores = initial
     montos_form = MontosForm(initial=initial_montos, factor_defs=def_map)
     factores_form = FactoresForm(initial=initial_factores, factor_defs=def_map)
 
-    if not calif.factores.exists():
+    # Reutiliza lo ya leído en _initial_data (evita un SELECT extra)
+    if not initial_factores:
         messages.warning(request, "⚠️ Calificación incompleta. Debes ingresar montos o factores.")
 
-    return render(request, "calificaciones/form_factores.html", {
-        "calif": calif,
-        "montos_form": montos_form,
-        "factores_form": factores_form,
-        "def_map": def_map,
-        "modo_ingreso": modo_ingreso,
-    })
+    return _render(montos_form, factores_form)
 
 
 # =============================================================================
@@ -464,20 +611,35 @@ def calificacion_delete(request):
     Si no hay IDs o ninguna coincide → muestra error.
     """
     if request.method == "POST":
-        ids = request.POST.getlist("ids[]")
+        # Valida y deduplica en una pasada (IDs no numéricos se ignoran)
+        ids = list({int(i) for i in request.POST.getlist("ids[]") if i.isdecimal()})
         if not ids:
             messages.error(request, "❌ No se seleccionaron calificaciones.")
             return redirect("main")
 
-        ids = [int(i) for i in ids]
-        calificaciones = TblCalificacion.objects.filter(pk__in=ids)
-        count = calificaciones.count()
+        # DELETE directo (sin COUNT previo ni collector del ORM): rowcount da
+        # cuántas existían realmente, sin carrera entre contar y borrar.
+        # La FK de TBL_FACTOR_VALOR no tiene ON DELETE CASCADE en BD (el
+        # CASCADE lo emula Django), así que primero se borran los factores.
+        # Los triggers de auditoría se disparan igual por fila.
+        # OJO: no se emiten señales pre/post_delete; si se agregan receptores
+        # para estos modelos, volver a usar QuerySet.delete().
+        qn = connection.ops.quote_name
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                f"DELETE FROM {qn(TblFactorValor._meta.db_table)} WHERE calificacion_id = ANY(%s)",
+                [ids],
+            )
+            cur.execute(
+                f"DELETE FROM {qn(TblCalificacion._meta.db_table)} WHERE calificacion_id = ANY(%s)",
+                [ids],
+            )
+            count = cur.rowcount
 
         if count == 0:
             messages.error(request, "❌ No se encontraron las calificaciones seleccionadas.")
             return redirect("main")
 
-        calificaciones.delete()
         messages.success(
             request,
             f"✅ {count} calificación{'es' if count > 1 else ''} eliminada{'s' if count > 1 else ''}."
@@ -504,24 +666,28 @@ def calificacion_detalles(request, pk: int):
         .get(pk=pk)
     )
 
-    # Factores 8..37 con su definición si está enlazada
+    # Factores 8..37 con su definición si está enlazada (un JOIN; solo las
+    # columnas que se muestran)
     factores_qs = (
         calificacion.factores
-        .filter(posicion__gte=8, posicion__lte=37)
+        .filter(posicion__gte=POS_MIN, posicion__lte=POS_MAX)
         .select_related("factor_def")
+        .only("posicion", "monto_base", "valor", "factor_def", "factor_def__nombre")
         .order_by("posicion")
     )
 
-    # Catálogo por posición (fallback para nombres)
-    def_map = {
-        d.posicion: d.nombre
-        for d in TblFactorDef.objects.filter(posicion__gte=8, posicion__lte=37, activo=True)
-    }
+    # Catálogo por posición (fallback para nombres; caché compartida, sin consulta a la BD)
+    def_map = _build_def_map()
 
     # Normaliza filas para el template
     factores_rows = []
     for fv in factores_qs:
-        nombre = fv.factor_def.nombre if fv.factor_def else def_map.get(fv.posicion, f"Factor {fv.posicion}")
+        if fv.factor_def:
+            nombre = fv.factor_def.nombre
+        elif fv.posicion in def_map:
+            nombre = def_map[fv.posicion].nombre
+        else:
+            nombre = f"Factor {fv.posicion}"
         factores_rows.append({
             "posicion": fv.posicion,
             "nombre": nombre,
@@ -6,6 +6,7 @@ Generated by 'django-admin startproject' using Django 5.2.7.
 
 import environ
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -79,6 +80,66 @@ SESSION_COOKIE_SECURE = False   # poner True en producción con HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = "Lax"
 
+# ==============================
+# CACHÉ
+# ==============================
+# default: en memoria por proceso. No sirve para datos que otro worker debe
+#   invalidar: las señales solo limpian la copia del proceso que guardó.
+# catalogos: mercados, tipos de ingreso y factores (TblFactorDef). Las señales
+#   de core/signals.py los borran al guardar/eliminar; al ser compartida, el
+#   borrado llega a todos los workers.
+# uploads: archivo de la vista previa de carga masiva (carga_archivo -> carga_confirmar).
+# catalogos y uploads se basan en archivos para compartirse entre workers del
+#   mismo host. En un despliegue con varios hosts, apuntar CATALOGOS_CACHE_DIR
+#   y UPLOAD_CACHE_DIR a un volumen compartido o cambiar el backend (p.ej. Redis).
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalogos": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": env(
+            "CATALOGOS_CACHE_DIR",
+            default=os.path.join(tempfile.gettempdir(), "nuam_catalogos"),
+        ),
+    },
+    # Previews pendientes de confirmar: al llenarse, FileBasedCache borra al
+    # azar 1/CULL_FREQUENCY de las entradas; con holgura y un cull chico no se
+    # pierden cargas en curso.
+    "uploads": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": env(
+            "UPLOAD_CACHE_DIR",
+            default=os.path.join(tempfile.gettempdir(), "nuam_uploads"),
+        ),
+        "TIMEOUT": SESSION_COOKIE_AGE,
+        "OPTIONS": {
+            "MAX_ENTRIES": env.int("UPLOAD_CACHE_MAX_ENTRIES", default=2000),
+            "CULL_FREQUENCY": 10,
+        },
+    },
+    # Resultados de pdfplumber por hash de contenido: se pueden recalcular,
+    # van aparte para no desalojar previews de "uploads".
+    "pdf_parse": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": env(
+            "PDF_PARSE_CACHE_DIR",
+            default=os.path.join(tempfile.gettempdir(), "nuam_pdf_parse"),
+        ),
+        "TIMEOUT": SESSION_COOKIE_AGE,
+    },
+}
+
+# ==============================
+# CARGA MASIVA
+# ==============================
+# Filas por sentencia en bulk_create/bulk_update y calificaciones por
+# transacción en carga_confirmar. Más grande = menos round-trips, pero más
+# memoria en instancias pendientes y sentencias más pesadas para Postgres.
+
+CALIF_BULK_BATCH_SIZE = env.int("CALIF_BULK_BATCH_SIZE", default=500)
+
 # ==============================
 # DATABASE
 # ==============================